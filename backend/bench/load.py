@@ -0,0 +1,247 @@
+"""Drives the API with realistic traffic mixes and reports latency percentiles.
+
+By default the app runs in process (ASGI, no sockets) on the embedded local
+storage backend, so no Astra or Redis is needed. Run from the backend directory:
+    python -m bench.load --scenario morning [--users 200] [--concurrency 32] [--duration 10]
+    python -m bench.load --scenario mixed --out results.json --baseline baseline.json
+    python -m bench.load --url http://localhost:8000   # a running uvicorn instead
+
+With --baseline the run fails (exit code 1) when an endpoint's p95 grew, or its
+throughput fell, by more than --tolerance.
+"""
+import argparse
+import asyncio
+import io
+import json
+import logging
+import os
+import random
+import sys
+from collections import defaultdict
+from time import perf_counter
+
+import numpy as np
+
+# Set before main is imported so the in-process app starts on the local backend
+os.environ.setdefault("STORAGE_BACKEND", "local")
+
+
+def meal_photo(seed):
+    # Small JPEG so uploads exercise the full decode path; a few variants give cache hits and misses
+    from PIL import Image
+    pixels = np.random.default_rng(seed).integers(0, 256, (48, 64, 3), dtype=np.uint8)
+    buffer = io.BytesIO()
+    Image.fromarray(pixels).resize((640, 480)).save(buffer, "JPEG")
+    return buffer.getvalue()
+
+
+PHOTOS = [meal_photo(seed) for seed in range(8)]
+
+
+def user_payload(user_id):
+    return {
+        "id": user_id,
+        "username": f"bench{user_id}",
+        "email": f"bench{user_id}@example.com",
+        "exercise_dur": 1.0,
+        "wake_up_time": "07:00:00",
+        "sleep_time": "23:00:00",
+        "unhealthy_food_limit": 2,
+        "meal_per_day": 3,
+    }
+
+
+# label -> request(client, user_id); labels are the route templates reported per endpoint
+REQUESTS = {
+    "POST /user/{id}/activity/sleep": lambda c, u: c.post(f"/user/{u}/activity/sleep"),
+    "POST /user/{id}/activity/wake": lambda c, u: c.post(f"/user/{u}/activity/wake"),
+    "POST /user/{id}/activity/meal": lambda c, u: c.post(
+        f"/user/{u}/activity/meal", json={"meal_name": "salad", "healthy_score": random.randint(1, 10)}
+    ),
+    "POST /user/{id}/activity/exercise": lambda c, u: c.post(
+        f"/user/{u}/activity/exercise", params={"exercise_dur": round(random.uniform(0, 2), 2)}
+    ),
+    "POST /analyse-food": lambda c, u: c.post(
+        "/analyse-food", files={"file": ("meal.jpg", random.choice(PHOTOS), "image/jpeg")}
+    ),
+    "GET /user/{id}": lambda c, u: c.get(f"/user/{u}"),
+    "GET /user/pet/{id}": lambda c, u: c.get(f"/user/pet/{u}"),
+    "GET /user/activity/{id}": lambda c, u: c.get(f"/user/activity/{u}"),
+    "GET /user/{id}/activity/history": lambda c, u: c.get(f"/user/{u}/activity/history"),
+    "GET /user/{id}/stats/rollups": lambda c, u: c.get(f"/user/{u}/stats/rollups", params={"period": "week"}),
+}
+
+# scenario -> {label: weight}
+SCENARIOS = {
+    # Everyone waking up at once: set_wake plus the app refreshing the pet screen
+    "morning": {
+        "POST /user/{id}/activity/wake": 6,
+        "GET /user/pet/{id}": 3,
+        "GET /user/activity/{id}": 1,
+    },
+    # Lunch: photos classified, then logged
+    "meals": {
+        "POST /analyse-food": 3,
+        "POST /user/{id}/activity/meal": 5,
+        "GET /user/activity/{id}": 2,
+    },
+    # Stats tab
+    "stats": {
+        "GET /user/{id}/stats/rollups": 4,
+        "GET /user/{id}/activity/history": 3,
+        "GET /user/pet/{id}": 2,
+        "GET /user/{id}": 1,
+    },
+    "mixed": {
+        "POST /user/{id}/activity/sleep": 1,
+        "POST /user/{id}/activity/wake": 2,
+        "POST /user/{id}/activity/meal": 3,
+        "POST /user/{id}/activity/exercise": 1,
+        "POST /analyse-food": 1,
+        "GET /user/{id}": 1,
+        "GET /user/pet/{id}": 4,
+        "GET /user/activity/{id}": 3,
+        "GET /user/{id}/activity/history": 1,
+        "GET /user/{id}/stats/rollups": 2,
+    },
+}
+
+
+async def seed(client, users, concurrency):
+    # Every simulated user gets a pet, an activity row and some history to read back
+    limit = asyncio.Semaphore(concurrency)
+
+    async def one(user_id):
+        async with limit:
+            await client.post("/user", json=user_payload(user_id))
+            await client.post(f"/user/{user_id}/activity/meal", json={"meal_name": "salad", "healthy_score": 7})
+            await client.post(f"/user/{user_id}/activity/sleep")
+
+    await asyncio.gather(*(one(user_id) for user_id in range(1, users + 1)))
+
+
+async def drive(client, mix, users, concurrency, duration):
+    labels, weights = zip(*mix.items())
+    latencies = defaultdict(list)
+    errors = defaultdict(int)
+    deadline = perf_counter() + duration
+
+    async def worker():
+        while perf_counter() < deadline:
+            label = random.choices(labels, weights)[0]
+            started = perf_counter()
+            try:
+                response = await REQUESTS[label](client, random.randint(1, users))
+                failed = response.status_code >= 500
+            except Exception:
+                failed = True
+            latencies[label].append(perf_counter() - started)
+            errors[label] += failed
+
+    started = perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return latencies, errors, perf_counter() - started
+
+
+def summarize(latencies, errors, elapsed):
+    def summary(samples, failed):
+        ms = np.asarray(samples) * 1000
+        p50, p95, p99 = np.percentile(ms, [50, 95, 99])
+        return {
+            "count": len(samples),
+            "errors": failed,
+            "rps": len(samples) / elapsed,
+            "mean_ms": float(ms.mean()),
+            "p50_ms": float(p50),
+            "p95_ms": float(p95),
+            "p99_ms": float(p99),
+        }
+
+    endpoints = {label: summary(samples, errors[label]) for label, samples in sorted(latencies.items())}
+    everything = [sample for samples in latencies.values() for sample in samples]
+    total = summary(everything, sum(errors.values())) if everything else {}
+    return {"elapsed_s": elapsed, "endpoints": endpoints, "total": total}
+
+
+def compare(result, baseline, tolerance):
+    # Regressions as readable lines; endpoints missing from either run are skipped
+    regressions = []
+    for label, now in result["endpoints"].items():
+        before = baseline["endpoints"].get(label)
+        if before is None:
+            continue
+        if now["p95_ms"] > before["p95_ms"] * (1 + tolerance):
+            regressions.append(f"{label}: p95 {before['p95_ms']:.2f}ms -> {now['p95_ms']:.2f}ms")
+        if now["rps"] < before["rps"] * (1 - tolerance):
+            regressions.append(f"{label}: throughput {before['rps']:.0f}/s -> {now['rps']:.0f}/s")
+        if now["errors"] > before["errors"]:
+            regressions.append(f"{label}: errors {before['errors']} -> {now['errors']}")
+    return regressions
+
+
+def print_table(result):
+    print(f"{'endpoint':40} {'count':>7} {'err':>5} {'rps':>8} {'p50':>8} {'p95':>8} {'p99':>8}")
+    for label, row in list(result["endpoints"].items()) + [("total", result["total"])]:
+        print(
+            f"{label:40} {row['count']:>7} {row['errors']:>5} {row['rps']:>8.1f} "
+            f"{row['p50_ms']:>8.2f} {row['p95_ms']:>8.2f} {row['p99_ms']:>8.2f}"
+        )
+
+
+async def run(args):
+    import httpx
+
+    if args.url:
+        client = httpx.AsyncClient(base_url=args.url, timeout=30)
+        await seed(client, args.users, args.concurrency)
+        try:
+            return await drive(client, SCENARIOS[args.scenario], args.users, args.concurrency, args.duration)
+        finally:
+            await client.aclose()
+
+    import main
+    async with main.app.router.lifespan_context(main.app):
+        transport = httpx.ASGITransport(app=main.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=30) as client:
+            await seed(client, args.users, args.concurrency)
+            # Warm-up pass (worker processes, lazy statement preparation, caches) is not measured
+            await drive(client, SCENARIOS[args.scenario], args.users, args.concurrency, min(1.0, args.duration))
+            return await drive(client, SCENARIOS[args.scenario], args.users, args.concurrency, args.duration)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--scenario", choices=sorted(SCENARIOS), default="mixed")
+    parser.add_argument("--users", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--duration", type=float, default=10.0, help="seconds of measured traffic")
+    parser.add_argument("--url", help="benchmark a running server instead of the in-process app")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--out", help="write results as JSON")
+    parser.add_argument("--baseline", help="results JSON from an earlier run to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="allowed relative slowdown (0.2 = 20%%)")
+    args = parser.parse_args()
+
+    random.seed(args.seed)
+    latencies, errors, elapsed = asyncio.run(run(args))
+    result = {"scenario": args.scenario, "config": vars(args), **summarize(latencies, errors, elapsed)}
+    print_table(result)
+
+    if args.out:
+        with open(args.out, "w") as f:
+            json.dump(result, f, indent=2)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        regressions = compare(result, baseline, args.tolerance)
+        for line in regressions:
+            print(f"REGRESSION {line}")
+        if regressions:
+            sys.exit(1)
+        print(f"No regressions against {args.baseline}")
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.WARNING)
+    main()
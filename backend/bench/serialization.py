@@ -0,0 +1,74 @@
+"""Per-request CPU of serving a cached pet: decode + FastAPI encode vs pre-encoded bytes.
+
+Run from the backend directory:
+    python -m bench.serialization [--iterations 20000]
+"""
+import argparse
+import asyncio
+import json
+from time import perf_counter
+
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+from fastapi.routing import serialize_response
+
+from serialization import JSONBytesResponse, dumps
+
+PET = {
+    "pet_id": 1,
+    "pet_name": "bench's Pet",
+    "happiness": 87,
+    "diet": 66,
+    "exercise": 100,
+    "sleep": 92,
+    "wake_up_time": "07:00:00",
+    "sleep_time": "23:00:00",
+    "exercise_dur": 1.0,
+    "unhealthy_food_limit": 2,
+    "meal_per_day": 3,
+}
+ACTIVITY = {
+    "activity_id": 1,
+    "date": "2025-01-01",
+    "wake_up_time": None,
+    "sleep_time": "23:10:00",
+    "exercise_duration": 1.5,
+    "meals": [{"meal_name": f"meal {i}", "healthy_score": i} for i in range(5)],
+}
+
+
+async def decode_and_encode(cached):
+    # Previous path: json.loads of the cached string, then FastAPI's response encoding
+    value = json.loads(cached)
+    content = await serialize_response(response_content=value, is_coroutine=True)
+    return JSONResponse(jsonable_encoder(content)).body
+
+
+async def pre_encoded(cached):
+    # Current path: the cached bytes become the body as-is
+    return JSONBytesResponse(cached).body
+
+
+def measure(fn, cached, iterations):
+    async def run():
+        started = perf_counter()
+        for _ in range(iterations):
+            await fn(cached)
+        return (perf_counter() - started) / iterations * 1e6
+
+    return asyncio.run(run())
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--iterations", type=int, default=20000)
+    args = parser.parse_args()
+
+    for name, value in (("pet", PET), ("activity", ACTIVITY)):
+        before = measure(decode_and_encode, json.dumps(value), args.iterations)
+        after = measure(pre_encoded, dumps(value), args.iterations)
+        print(f"{name:10} decode+encode {before:7.2f}us  pre-encoded {after:7.2f}us  saved {before - after:7.2f}us/request")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,67 @@
+import json
+import os
+
+from redis import asyncio as aioredis
+
+from storage.base import STORAGE_BACKEND
+
+# One pool per worker process shared by every module that talks to Redis.
+# BlockingConnectionPool makes callers wait for a free connection instead of
+# opening an unbounded number of sockets under load.
+REDIS_URL = os.getenv("REDIS_URL", "redis://localhost:6379/0")
+REDIS_MAX_CONNECTIONS = int(os.getenv("REDIS_MAX_CONNECTIONS", "64"))
+REDIS_POOL_TIMEOUT = float(os.getenv("REDIS_POOL_TIMEOUT", "5"))
+
+if STORAGE_BACKEND == "local":
+    # No Redis server needed: fakeredis (with lupa for the Lua scripts) answers the same
+    # commands in process, so the local backend still runs every cache code path
+    import fakeredis
+
+    pool = None
+    redis_client = fakeredis.FakeAsyncRedis(decode_responses=True)
+else:
+    pool = aioredis.BlockingConnectionPool.from_url(
+        REDIS_URL,
+        max_connections=REDIS_MAX_CONNECTIONS,
+        timeout=REDIS_POOL_TIMEOUT,
+        decode_responses=True,
+    )
+    redis_client = aioredis.Redis(connection_pool=pool)
+
+
+def pipeline():
+    # Non-transactional pipeline: queue commands, send them in one round trip
+    return redis_client.pipeline(transaction=False)
+
+
+async def mget(keys):
+    if not keys:
+        return []
+    return await redis_client.mget(keys)
+
+
+async def mset(mapping, ex=None):
+    # MSET has no expiry option, so with a TTL the SETs are pipelined instead
+    if not mapping:
+        return
+    if ex is None:
+        await redis_client.mset(mapping)
+        return
+    async with pipeline() as pipe:
+        for key, value in mapping.items():
+            pipe.set(key, value, ex=ex)
+        await pipe.execute()
+
+
+async def mget_json(keys):
+    return [json.loads(value) if value is not None else None for value in await mget(keys)]
+
+
+async def mset_json(mapping, ex=None):
+    await mset({key: json.dumps(value) for key, value in mapping.items()}, ex=ex)
+
+
+async def close_redis():
+    await redis_client.aclose()
+    if pool is not None:
+        await pool.disconnect()
@@ -0,0 +1,95 @@
+import asyncio
+import logging
+import os
+import time
+from collections import OrderedDict
+
+# In-process tier sitting in front of Redis. Entries are short lived so a worker
+# that misses an invalidation (e.g. Redis reconnect) is never stale for long.
+LOCAL_CACHE_SIZE = int(os.getenv("LOCAL_CACHE_SIZE", "10000"))
+LOCAL_CACHE_TTL = float(os.getenv("LOCAL_CACHE_TTL", "30"))
+
+# Workers publish changed keys here; every worker drops them from its local tier
+INVALIDATION_CHANNEL = "cache:invalidate"
+
+MISS = object()
+
+
+class LocalCache:
+    """Bounded LRU cache with a per-entry TTL and hit/miss/eviction counters."""
+
+    def __init__(self, maxsize=LOCAL_CACHE_SIZE, ttl=LOCAL_CACHE_TTL):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = OrderedDict()  # key -> (expires_at, value)
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.invalidations = 0
+
+    def get(self, key):
+        entry = self._data.get(key)
+        if entry is None:
+            self.misses += 1
+            return MISS
+        if entry[0] < time.monotonic():
+            del self._data[key]
+            self.expirations += 1
+            self.misses += 1
+            return MISS
+        self._data.move_to_end(key)
+        self.hits += 1
+        return entry[1]
+
+    def set(self, key, value, ttl=None):
+        expires_at = time.monotonic() + (self.ttl if ttl is None else ttl)
+        self._data[key] = (expires_at, value)
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+            self.evictions += 1
+
+    def delete(self, key):
+        if self._data.pop(key, None) is not None:
+            self.invalidations += 1
+
+    def clear(self):
+        self._data.clear()
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self._data),
+            "maxsize": self.maxsize,
+            "ttl": self.ttl,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": self.hits / lookups if lookups else 0.0,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+            "invalidations": self.invalidations,
+        }
+
+
+def queue_invalidation(pipe, *keys):
+    # Adds the publish to a pipeline so it rides along with the write it belongs to
+    for key in keys:
+        pipe.publish(INVALIDATION_CHANNEL, key)
+
+
+async def listen_for_invalidations(redis_client, local_cache):
+    # Runs for the life of the worker; start it as a task and cancel it at shutdown
+    while True:
+        try:
+            async with redis_client.pubsub(ignore_subscribe_messages=True) as pubsub:
+                await pubsub.subscribe(INVALIDATION_CHANNEL)
+                async for message in pubsub.listen():
+                    local_cache.delete(message["data"])
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            # Messages may have been lost while disconnected, so start from empty
+            logging.error(f"Cache invalidation listener disconnected: {e}")
+            local_cache.clear()
+            await asyncio.sleep(1)
@@ -0,0 +1,123 @@
+import asyncio
+from collections import Counter
+
+from cache.local import MISS
+from cache.versions import entry, new_version, split_entry
+from serialization import dumps, loads
+
+# Cache lifetimes in seconds
+DEFAULT_TTL = 3600
+NEGATIVE_TTL = 60
+
+# Stored in place of a value when the row does not exist, so repeated 404s skip Cassandra
+NEGATIVE = "__missing__"
+
+
+class SingleFlight:
+    """Coalesces concurrent loads of the same key into one call."""
+
+    def __init__(self):
+        self._calls = {}
+
+    async def do(self, key, fn):
+        task = self._calls.get(key)
+        if task is None:
+            task = asyncio.ensure_future(fn())
+            self._calls[key] = task
+            task.add_done_callback(lambda _: self._calls.pop(key, None))
+        # shield: a cancelled caller must not cancel the load other callers wait on
+        return await asyncio.shield(task)
+
+
+flights = SingleFlight()
+
+# Redis-tier outcomes of every read_through / read_through_many lookup (for /metrics)
+lookups = Counter()
+
+
+def _encoded(cached):
+    # Redis hands back str (decode_responses); the local tier and responses use bytes
+    return NEGATIVE if cached == NEGATIVE else cached.encode()
+
+
+async def _fill(redis_client, key, loader, ttl, negative_ttl, local):
+    value = await loader()
+    encoded = NEGATIVE if value is None else entry(new_version(value), dumps(value))
+    # NX: a write that set the key while the row was loading has the newer value
+    if not await redis_client.set(key, encoded, ex=negative_ttl if value is None else ttl, nx=True):
+        cached = await redis_client.get(key)
+        if cached is None:
+            # Dropped again in the meantime; serve what was loaded without caching it
+            return encoded
+        encoded = _encoded(cached)
+    if local is not None:
+        local.set(key, encoded, ttl=min(local.ttl, negative_ttl) if encoded == NEGATIVE else None)
+    return encoded
+
+
+async def _lookup(redis_client, key, loader, ttl, negative_ttl, local):
+    # The stored entry (bytes) or NEGATIVE, from the local tier, Redis or the loader
+    if local is not None:
+        encoded = local.get(key)
+        if encoded is not MISS:
+            return encoded
+
+    cached = await redis_client.get(key)
+    lookups["redis_hits" if cached is not None else "redis_misses"] += 1
+    if cached is not None:
+        encoded = _encoded(cached)
+        if local is not None:
+            local.set(key, encoded)
+        return encoded
+
+    return await flights.do(key, lambda: _fill(redis_client, key, loader, ttl, negative_ttl, local))
+
+
+async def read_through_entry(redis_client, key, loader, ttl=DEFAULT_TTL, negative_ttl=NEGATIVE_TTL, local=None):
+    # (version, JSON bytes) of the cached or freshly loaded value, None when the loader
+    # found nothing. With a LocalCache, the in-process tier is checked before Redis.
+    encoded = await _lookup(redis_client, key, loader, ttl, negative_ttl, local)
+    return None if encoded == NEGATIVE else split_entry(encoded)
+
+
+async def read_through_raw(redis_client, key, loader, ttl=DEFAULT_TTL, negative_ttl=NEGATIVE_TTL, local=None):
+    # Like read_through, but returns the cached JSON bytes as stored, so a handler can
+    # send them without decoding/re-encoding
+    found = await read_through_entry(redis_client, key, loader, ttl, negative_ttl, local)
+    return None if found is None else found[1]
+
+
+async def read_through(redis_client, key, loader, ttl=DEFAULT_TTL, negative_ttl=NEGATIVE_TTL, local=None):
+    # Returns the cached or freshly loaded value, or None when the loader found nothing
+    encoded = await read_through_raw(redis_client, key, loader, ttl, negative_ttl, local)
+    return None if encoded is None else loads(encoded)
+
+
+async def read_through_many(redis_client, loaders, ttl=DEFAULT_TTL, negative_ttl=NEGATIVE_TTL, local=None):
+    # Same as read_through for several keys ({key: loader}): one MGET for everything
+    # not held locally, then concurrent loads for whatever Redis is missing.
+    found = {}
+    pending = []
+    for key in loaders:
+        encoded = local.get(key) if local is not None else MISS
+        if encoded is MISS:
+            pending.append(key)
+        else:
+            found[key] = encoded
+
+    if pending:
+        for key, cached in zip(pending, await redis_client.mget(pending)):
+            lookups["redis_hits" if cached is not None else "redis_misses"] += 1
+            if cached is not None:
+                found[key] = _encoded(cached)
+                if local is not None:
+                    local.set(key, found[key])
+
+        misses = [key for key in pending if key not in found]
+        loaded = await asyncio.gather(*(
+            flights.do(key, lambda key=key: _fill(redis_client, key, loaders[key], ttl, negative_ttl, local))
+            for key in misses
+        ))
+        found.update(zip(misses, loaded))
+
+    return [None if found[key] == NEGATIVE else loads(split_entry(found[key])[1]) for key in loaders]
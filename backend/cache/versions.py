@@ -0,0 +1,33 @@
+import uuid
+
+# Versions behind the ETags of cached documents. A cached entry is stored as
+# "<version> <JSON>": the version travels with the document through Redis and the
+# local tier, so whichever tier answers a read also answers its ETag. Every write of
+# the cached copy gives it a new random token; a copy loaded on a miss gets one too.
+# Pets append "@<stats_updated_at>" so a tag can follow decay without decoding the body.
+#
+# Entries cached before versions existed start straight with the JSON and have none.
+
+
+def new_version(value=None):
+    token = uuid.uuid4().hex[:16]
+    stats_updated_at = value.get("stats_updated_at") if isinstance(value, dict) else None
+    return f"{token}@{stats_updated_at}" if stats_updated_at else token
+
+
+def entry(version, encoded):
+    # Cached form of a document's JSON bytes
+    return version.encode() + b" " + encoded
+
+
+def split_entry(cached):
+    # (version, JSON bytes) of a cached entry; the version is "" for unversioned entries
+    if cached[:1] in (b"{", b"["):
+        return "", cached
+    version, _, encoded = cached.partition(b" ")
+    return version.decode(), encoded
+
+
+def stats_updated_at(version):
+    # The pet's stats_updated_at carried in a version, None for other documents
+    return version.partition("@")[2] or None
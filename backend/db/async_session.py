@@ -0,0 +1,94 @@
+import asyncio
+import os
+
+from cassandra.query import BatchStatement, BatchType, SimpleStatement
+
+# Max number of Cassandra requests a single worker keeps in flight at once.
+# Requests over the limit wait on the event loop instead of piling up in the driver.
+MAX_IN_FLIGHT = int(os.getenv("CASSANDRA_MAX_IN_FLIGHT", "256"))
+
+
+class _PageWaiter:
+    # The driver fires callbacks on its own IO thread, once per page, so each
+    # result is handed back to the event loop through call_soon_threadsafe.
+
+    def __init__(self, loop, response_future):
+        self.loop = loop
+        self.waiter = loop.create_future()
+        response_future.add_callbacks(self._on_result, self._on_error)
+
+    def next(self):
+        self.waiter = self.loop.create_future()
+        return self.waiter
+
+    def _on_result(self, rows):
+        self.loop.call_soon_threadsafe(self._resolve, self.waiter, rows, None)
+
+    def _on_error(self, exc):
+        self.loop.call_soon_threadsafe(self._resolve, self.waiter, None, exc)
+
+    @staticmethod
+    def _resolve(waiter, rows, exc):
+        if waiter.done():
+            return
+        if exc is not None:
+            waiter.set_exception(exc)
+        else:
+            waiter.set_result(rows)
+
+
+class AsyncSession:
+    """Awaitable wrapper around a cassandra-driver Session."""
+
+    def __init__(self, session, max_in_flight=MAX_IN_FLIGHT):
+        self.session = session
+        self.max_in_flight = max_in_flight
+        self._limit = asyncio.Semaphore(max_in_flight)
+
+    @property
+    def in_flight(self):
+        return self.max_in_flight - self._limit._value
+
+    async def execute(self, query, parameters=None, **kwargs):
+        # Returns the driver's ResultSet, so callers keep using .one() / iteration
+        async with self._limit:
+            response_future = self.session.execute_async(query, parameters, **kwargs)
+            await _PageWaiter(asyncio.get_running_loop(), response_future).waiter
+        return response_future.result()
+
+    async def execute_many(self, statements_and_params):
+        # Runs independent statements concurrently (still bounded by the in-flight limit)
+        return await asyncio.gather(*(
+            self.execute(query, parameters) for query, parameters in statements_and_params
+        ))
+
+    async def execute_batch(self, statements_and_params, batch_type=BatchType.LOGGED):
+        # Several writes in a single round trip to the coordinator
+        batch = BatchStatement(batch_type=batch_type)
+        for query, parameters in statements_and_params:
+            batch.add(query, parameters)
+        return await self.execute(batch)
+
+    async def iter_pages(self, query, parameters=None, fetch_size=1000):
+        # Yields one page (list of rows) at a time without ever blocking on the next page
+        if isinstance(query, str):
+            query = SimpleStatement(query, fetch_size=fetch_size)
+        elif hasattr(query, "bind"):
+            query = query.bind(parameters or ())
+            query.fetch_size = fetch_size
+            parameters = None
+
+        loop = asyncio.get_running_loop()
+        async with self._limit:
+            response_future = self.session.execute_async(query, parameters)
+            pages = _PageWaiter(loop, response_future)
+            rows = await pages.waiter
+
+        while True:
+            yield rows
+            if not response_future.has_more_pages:
+                return
+            async with self._limit:
+                waiter = pages.next()
+                response_future.start_fetching_next_page()
+                rows = await waiter
@@ -0,0 +1,17 @@
+import json
+
+from cassandra.cluster import Cluster
+from cassandra.auth import PlainTextAuthProvider
+
+# Astra connection settings shared by the API and the offline jobs
+SECURE_CONNECT_BUNDLE = 'secure-connect-pet-db.zip'
+KEYSPACE = "pet"
+
+
+def connect(token_path="token.json"):
+    with open(token_path) as f:
+        secrets = json.load(f)
+
+    auth_provider = PlainTextAuthProvider(secrets["clientId"], secrets["secret"])
+    cluster = Cluster(cloud={'secure_connect_bundle': SECURE_CONNECT_BUNDLE}, auth_provider=auth_provider)
+    return cluster, cluster.connect()
@@ -0,0 +1,14 @@
+import json
+
+
+def meal_values(meals):
+    # Bind value for the meal_log list<frozen<meal>> column; UDTs bind from tuples
+    return [(meal["meal_name"], meal["healthy_score"]) for meal in meals or []]
+
+
+def meals_from_row(row):
+    # Activity and history rows written before meal_log existed hold the day's earlier
+    # meals as JSON in `meals`; appends after that land in meal_log, so a day can have
+    # both (a full rewrite of the row moves everything into meal_log and clears `meals`).
+    meals = json.loads(row.meals) if getattr(row, "meals", None) else []
+    return meals + [{"meal_name": meal.meal_name, "healthy_score": meal.healthy_score} for meal in row.meal_log or ()]
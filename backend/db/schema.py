@@ -0,0 +1,121 @@
+import logging
+
+from cassandra import InvalidRequest
+
+# Tables the API relies on. Run as a migration step (`python -m db.schema`), or at
+# startup with CASSANDRA_BOOTSTRAP_SCHEMA=1; never on the request path.
+TABLES = [
+    """
+    CREATE TYPE IF NOT EXISTS {keyspace}.meal (
+        meal_name TEXT,
+        healthy_score INT
+    );
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS {keyspace}.userspace (
+        id INT PRIMARY KEY,
+        username TEXT,
+        email TEXT,
+        created_at TIMESTAMP
+    );
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS {keyspace}.petspace (
+        pet_id INT PRIMARY KEY,
+        pet_name TEXT,
+        happiness INT,
+        diet INT,
+        exercise INT,
+        sleep INT,
+        exercise_dur FLOAT,
+        wake_up_time TEXT,
+        sleep_time TEXT,
+        unhealthy_food_limit INT,
+        meal_per_day INT,
+        stats_updated_at TIMESTAMP  -- happiness..sleep are as of this time (see decay.py)
+    );
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS {keyspace}.activityspace (
+        activity_id INT PRIMARY KEY,
+        date DATE,
+        wake_up_time TEXT,  -- Store as string (ISO 8601 format)
+        sleep_time TEXT,    -- Store as string (ISO 8601 format)
+        exercise_duration FLOAT,  -- Float for exercise duration in hours or minutes
+        meals TEXT,  -- Legacy: meals as a JSON string, superseded by meal_log
+        meal_log LIST<FROZEN<meal>>
+    );
+    """,
+    # Append-only daily history, one partition per user per year so a week or
+    # month is a single bounded slice of one partition (newest first)
+    """
+    CREATE TABLE IF NOT EXISTS {keyspace}.activity_history (
+        user_id INT,
+        year INT,
+        date DATE,
+        wake_up_time TEXT,
+        sleep_time TEXT,
+        exercise_duration FLOAT,
+        meals TEXT,  -- Legacy: meals as a JSON string, superseded by meal_log
+        meal_log LIST<FROZEN<meal>>,
+        sleep_hours FLOAT,
+        PRIMARY KEY ((user_id, year), date)
+    ) WITH CLUSTERING ORDER BY (date DESC);
+    """,
+    # Incrementally maintained totals per day/week/month (see rollups.py)
+    """
+    CREATE TABLE IF NOT EXISTS {keyspace}.activity_rollup (
+        user_id INT,
+        period TEXT,
+        period_start DATE,
+        exercise_milli COUNTER,
+        meals COUNTER,
+        healthy_score COUNTER,
+        sleep_milli_hours COUNTER,
+        nights COUNTER,
+        PRIMARY KEY ((user_id, period), period_start)
+    ) WITH CLUSTERING ORDER BY (period_start DESC);
+    """,
+    # Friend groups a user belongs to; group leaderboards live in Redis (see leaderboard.py)
+    """
+    CREATE TABLE IF NOT EXISTS {keyspace}.friend_group_member (
+        user_id INT,
+        group_id TEXT,
+        PRIMARY KEY (user_id, group_id)
+    );
+    """,
+]
+
+# Columns added to existing tables after they were first created: (table, column, type)
+COLUMNS = [
+    ("activityspace", "meal_log", "LIST<FROZEN<meal>>"),
+    ("activity_history", "meal_log", "LIST<FROZEN<meal>>"),
+    ("petspace", "stats_updated_at", "TIMESTAMP"),
+]
+
+
+def bootstrap_schema(session, keyspace):
+    for ddl in TABLES:
+        session.execute(ddl.format(keyspace=keyspace))
+
+    tables = session.cluster.metadata.keyspaces[keyspace].tables
+    for table, column, cql_type in COLUMNS:
+        if column in tables[table].columns:
+            continue
+        try:
+            session.execute(f"ALTER TABLE {keyspace}.{table} ADD {column} {cql_type}")
+        except InvalidRequest as e:
+            # Another worker or deploy added it since the metadata was read
+            if "conflicts with an existing column" not in str(e) and "already exist" not in str(e):
+                raise
+    logging.info(f"Schema for keyspace '{keyspace}' checked/created successfully.")
+
+
+if __name__ == "__main__":
+    # Migration entry point: `python -m db.schema` from the backend directory
+    from db.connection import KEYSPACE, connect
+
+    logging.basicConfig(level=logging.INFO)
+    cluster, session = connect()
+    bootstrap_schema(session, KEYSPACE)
+    cluster.shutdown()
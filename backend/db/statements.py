@@ -0,0 +1,175 @@
+import asyncio
+
+# Every CQL statement the API sends, prepared once per worker and reused.
+STATEMENTS = {
+    "insert_user": """
+        INSERT INTO {keyspace}.userspace (id, username, email, created_at)
+        VALUES (?, ?, ?, ?)
+    """,
+    "select_user": """
+        SELECT id, username, email FROM {keyspace}.userspace WHERE id = ?
+    """,
+    "insert_pet": """
+        INSERT INTO {keyspace}.petspace
+        (pet_id, pet_name, happiness, diet, exercise, sleep, exercise_dur, wake_up_time, sleep_time, unhealthy_food_limit, meal_per_day, stats_updated_at)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+    """,
+    "select_pet": """
+        SELECT pet_id, pet_name, happiness, diet, exercise, sleep,
+               wake_up_time, sleep_time, exercise_dur, unhealthy_food_limit, meal_per_day, stats_updated_at
+        FROM {keyspace}.petspace WHERE pet_id = ?
+    """,
+    "update_pet": """
+        UPDATE {keyspace}.petspace
+        SET pet_name = ?, happiness = ?, diet = ?, exercise = ?, sleep = ?,
+            wake_up_time = ?, sleep_time = ?, exercise_dur = ?,
+            unhealthy_food_limit = ?, meal_per_day = ?, stats_updated_at = ?
+        WHERE pet_id = ?
+    """,
+    "insert_activity": """
+        INSERT INTO {keyspace}.activityspace
+        (activity_id, date, wake_up_time, sleep_time, exercise_duration, meal_log)
+        VALUES (?, ?, ?, ?, ?, ?)
+    """,
+    "select_activity": """
+        SELECT activity_id, date, wake_up_time, sleep_time, exercise_duration, meals, meal_log
+        FROM {keyspace}.activityspace WHERE activity_id = ?
+    """,
+    "update_activity": """
+        UPDATE {keyspace}.activityspace
+        SET date = ?, wake_up_time = ?, sleep_time = ?,
+            exercise_duration = ?, meal_log = ?, meals = null
+        WHERE activity_id = ?
+    """,
+    "append_meal": """
+        UPDATE {keyspace}.activityspace SET meal_log = meal_log + ? WHERE activity_id = ?
+    """,
+    "append_history_meal": """
+        UPDATE {keyspace}.activity_history SET meal_log = meal_log + ?
+        WHERE user_id = ? AND year = ? AND date = ?
+    """,
+    "insert_history": """
+        INSERT INTO {keyspace}.activity_history
+        (user_id, year, date, wake_up_time, sleep_time, exercise_duration, meals, meal_log, sleep_hours)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+    """,
+    "select_history": """
+        SELECT date, wake_up_time, sleep_time, exercise_duration, meals, meal_log, sleep_hours
+        FROM {keyspace}.activity_history
+        WHERE user_id = ? AND year = ? AND date >= ? AND date <= ?
+        LIMIT ?
+    """,
+    "increment_rollup": """
+        UPDATE {keyspace}.activity_rollup
+        SET exercise_milli = exercise_milli + ?, meals = meals + ?, healthy_score = healthy_score + ?,
+            sleep_milli_hours = sleep_milli_hours + ?, nights = nights + ?
+        WHERE user_id = ? AND period = ? AND period_start = ?
+    """,
+    "select_rollups": """
+        SELECT period_start, exercise_milli, meals, healthy_score, sleep_milli_hours, nights
+        FROM {keyspace}.activity_rollup
+        WHERE user_id = ? AND period = ? AND period_start >= ? AND period_start <= ?
+    """,
+    # Rollup backfill (jobs/backfill_rollups.py)
+    "scan_users": """
+        SELECT id, created_at FROM {keyspace}.userspace
+    """,
+    "select_user_created": """
+        SELECT id, created_at FROM {keyspace}.userspace WHERE id = ?
+    """,
+    "select_history_year": """
+        SELECT date, exercise_duration, meals, meal_log, sleep_hours
+        FROM {keyspace}.activity_history WHERE user_id = ? AND year = ?
+    """,
+    "select_all_rollups": """
+        SELECT period_start, exercise_milli, meals, healthy_score, sleep_milli_hours, nights
+        FROM {keyspace}.activity_rollup WHERE user_id = ? AND period = ?
+    """,
+    # Bulk stat recompute (jobs/recompute_stats.py)
+    "scan_activities": """
+        SELECT activity_id, sleep_time, exercise_duration, meals, meal_log FROM {keyspace}.activityspace
+    """,
+    "select_pet_goals": """
+        SELECT pet_id, exercise_dur, meal_per_day FROM {keyspace}.petspace WHERE pet_id = ?
+    """,
+    "update_pet_stats": """
+        UPDATE {keyspace}.petspace
+        SET happiness = ?, diet = ?, exercise = ?, sleep = ?, stats_updated_at = ?
+        WHERE pet_id = ?
+    """,
+    # Friend group leaderboards (leaderboard.py, jobs/rebuild_leaderboards.py)
+    "insert_group_member": """
+        INSERT INTO {keyspace}.friend_group_member (user_id, group_id) VALUES (?, ?)
+    """,
+    "delete_group_member": """
+        DELETE FROM {keyspace}.friend_group_member WHERE user_id = ? AND group_id = ?
+    """,
+    "select_user_groups": """
+        SELECT group_id FROM {keyspace}.friend_group_member WHERE user_id = ?
+    """,
+    "scan_group_members": """
+        SELECT user_id, group_id FROM {keyspace}.friend_group_member
+    """,
+    "scan_pet_happiness": """
+        SELECT pet_id, pet_name, happiness, stats_updated_at FROM {keyspace}.petspace
+    """,
+}
+
+
+def update_name(table, columns):
+    return f"update {table} {','.join(columns)}"
+
+
+def update_query(table, columns, keys):
+    # UPDATE of just `columns` (SET a = ?, ... WHERE k = ? AND ...). Binds the column
+    # values first, then the key values, in the given order.
+    return (
+        f"UPDATE {{keyspace}}.{table} SET {', '.join(f'{column} = ?' for column in columns)} "
+        f"WHERE {' AND '.join(f'{key} = ?' for key in keys)}"
+    )
+
+
+# Column sets written on every sleep/exercise log, prepared at startup with the rest
+STATEMENTS.update({
+    update_name(table, columns): update_query(table, columns, keys)
+    for table, columns, keys in (
+        ("activityspace", ("sleep_time",), ("activity_id",)),
+        ("activityspace", ("exercise_duration",), ("activity_id",)),
+        ("activity_history", ("exercise_duration",), ("user_id", "year", "date")),
+    )
+})
+
+
+class StatementRegistry:
+    def __init__(self, session, keyspace, statements=STATEMENTS):
+        self.session = session
+        self.keyspace = keyspace
+        self.statements = statements
+        self._prepared = {}
+        self._names = {}  # id(prepared statement) -> name, for metrics labels
+
+    async def prepare_all(self):
+        # session.prepare() blocks, so prepare everything in parallel off the event loop
+        await asyncio.gather(*(self._prepare(name, query) for name, query in self.statements.items()))
+
+    async def _prepare(self, name, query):
+        prepared = await asyncio.to_thread(self.session.prepare, query.format(keyspace=self.keyspace))
+        self._prepared[name] = prepared
+        self._names[id(prepared)] = name
+        return prepared
+
+    def __getitem__(self, name):
+        # Everything in STATEMENTS is prepared by prepare_all() before the first request
+        return self._prepared[name]
+
+    async def update(self, table, columns, keys):
+        # Prepared UPDATE of just `columns`. Sets that are not in STATEMENTS (arbitrary
+        # PATCH bodies) are prepared on first use, off the event loop like prepare_all.
+        name = update_name(table, columns)
+        if name in self._prepared:
+            return self._prepared[name]
+        return await self._prepare(name, update_query(table, columns, keys))
+
+    def name_of(self, query):
+        # Name of a prepared (or bound) statement from this registry, None for anything else
+        return self._names.get(id(getattr(query, "prepared_statement", query)))
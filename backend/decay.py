@@ -0,0 +1,61 @@
+import os
+from datetime import datetime, timezone
+
+# Pet stats wear off between check-ins, Tamagotchi style, without any job rewriting
+# pets: a row keeps each stat as of `stats_updated_at`, and its current value is
+# stored value - rate * hours since then (never below 0), computed when the pet is
+# read. Only real events (wake, pet updates) store new values and move the timestamp.
+STATS = ("happiness", "diet", "exercise", "sleep")
+
+# Points lost per hour, per stat (1.0 takes a full stat to 0 in a little over four days)
+DECAY_PER_HOUR = {
+    stat: float(os.getenv(f"DECAY_{stat.upper()}_PER_HOUR", default))
+    for stat, default in (("happiness", "1.0"), ("diet", "1.5"), ("exercise", "1.0"), ("sleep", "1.0"))
+}
+
+
+def now():
+    return datetime.now(timezone.utc)
+
+
+def stamp(moment=None):
+    # Stored form of stats_updated_at: ISO 8601 in UTC. Naive datetimes are taken as
+    # UTC, which is how the Cassandra driver returns TIMESTAMP columns.
+    moment = moment or now()
+    if moment.tzinfo is None:
+        moment = moment.replace(tzinfo=timezone.utc)
+    return moment.astimezone(timezone.utc).isoformat()
+
+
+def parse(value):
+    # stats_updated_at (a stamp() string or a datetime) as an aware datetime, or None
+    if not value:
+        return None
+    if isinstance(value, str):
+        value = datetime.fromisoformat(value)
+    return value if value.tzinfo is not None else value.replace(tzinfo=timezone.utc)
+
+
+def decayed(value, updated_at, rate, at):
+    # Only whole points are lost, so a stat reads back unchanged until a point has worn off
+    hours = max((at - updated_at).total_seconds() / 3600, 0.0)
+    return max(value - int(rate * hours), 0)
+
+
+def steps(stats_updated_at, at=None):
+    # Whole points each stat has lost by `at`; the decayed pet only changes when one of these does
+    hours = max(((parse(at) or now()) - parse(stats_updated_at)).total_seconds() / 3600, 0.0)
+    return tuple(int(DECAY_PER_HOUR[stat] * hours) for stat in STATS)
+
+
+def current(pet, at=None):
+    # The pet dict with its stats as of `at` (default now); the stored values are untouched.
+    # Pets stored before stats_updated_at existed have nothing to decay from.
+    updated_at = parse(pet.get("stats_updated_at")) if pet else None
+    if updated_at is None:
+        return pet
+    at = parse(at) or now()
+    return dict(pet, **{
+        stat: decayed(pet[stat], updated_at, DECAY_PER_HOUR[stat], at)
+        for stat in STATS if pet.get(stat) is not None
+    })
@@ -0,0 +1,149 @@
+import asyncio
+import os
+
+# A batch is sent as soon as it has FOOD_BATCH_SIZE images or its oldest image
+# has waited FOOD_BATCH_WINDOW_MS, whichever comes first
+FOOD_BATCH_SIZE = int(os.getenv("FOOD_BATCH_SIZE", "16"))
+FOOD_BATCH_WINDOW_MS = float(os.getenv("FOOD_BATCH_WINDOW_MS", "20"))
+# Images queued or being classified before new uploads are turned away with 503
+FOOD_MAX_PENDING = int(os.getenv("FOOD_MAX_PENDING", "256"))
+
+
+class Overloaded(Exception):
+    pass
+
+
+class MicroBatcher:
+    """Coalesces concurrent submit() calls into batched run_batch(items) calls.
+
+    At most max_concurrent_batches batches run at once; while they do, new
+    items keep accumulating, so batches grow with load instead of queueing
+    one call per request.
+    """
+
+    def __init__(
+        self,
+        run_batch,
+        max_batch_size=FOOD_BATCH_SIZE,
+        window_ms=FOOD_BATCH_WINDOW_MS,
+        max_pending=FOOD_MAX_PENDING,
+        max_concurrent_batches=1,
+    ):
+        self.run_batch = run_batch
+        self.max_batch_size = max_batch_size
+        self.window = window_ms / 1000
+        self.max_pending = max_pending
+        self.max_concurrent_batches = max_concurrent_batches
+        self._pending = []  # (item, future, enqueued_at)
+        self._outstanding = 0
+        self._task = None
+        self._running = set()
+        self.batches = 0
+        self.items = 0
+        self.rejected = 0
+        self.largest_batch = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+
+    def full(self):
+        return self._outstanding >= self.max_pending
+
+    async def submit(self, item):
+        if self.full():
+            self.rejected += 1
+            raise Overloaded(f"{self._outstanding} images already pending")
+        loop = asyncio.get_running_loop()
+        if self._task is None or self._task.done():
+            self._wakeup = asyncio.Event()
+            self._slots = asyncio.Semaphore(self.max_concurrent_batches)
+            self._task = loop.create_task(self._run())
+
+        future = loop.create_future()
+        self._pending.append((item, future, loop.time()))
+        self._outstanding += 1
+        self._wakeup.set()
+        try:
+            return await future
+        finally:
+            self._outstanding -= 1
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            await self._wakeup.wait()
+            self._wakeup.clear()
+            if not self._pending:
+                continue
+            await self._slots.acquire()
+
+            deadline = self._pending[0][2] + self.window
+            while len(self._pending) < self.max_batch_size:
+                remaining = deadline - loop.time()
+                if remaining <= 0:
+                    break
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), remaining)
+                except asyncio.TimeoutError:
+                    break
+                self._wakeup.clear()
+
+            batch = self._pending[:self.max_batch_size]
+            del self._pending[:self.max_batch_size]
+            if self._pending:
+                self._wakeup.set()
+            # Requests that were cancelled (client went away) while queued are dropped
+            batch = [entry for entry in batch if not entry[1].done()]
+            if not batch:
+                self._slots.release()
+                continue
+
+            task = loop.create_task(self._dispatch(batch, loop.time()))
+            self._running.add(task)
+            task.add_done_callback(self._running.discard)
+
+    async def _dispatch(self, batch, started):
+        self.batches += 1
+        self.items += len(batch)
+        self.largest_batch = max(self.largest_batch, len(batch))
+        for _, _, enqueued_at in batch:
+            self.total_wait += started - enqueued_at
+            self.max_wait = max(self.max_wait, started - enqueued_at)
+
+        try:
+            results = await self.run_batch([item for item, _, _ in batch])
+        except Exception as e:
+            for _, future, _ in batch:
+                if not future.done():
+                    future.set_exception(e)
+        else:
+            for (_, future, _), result in zip(batch, results):
+                if not future.done():
+                    future.set_result(result)
+        finally:
+            self._slots.release()
+
+    async def close(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+        for task in list(self._running):
+            task.cancel()
+        for _, future, _ in self._pending:
+            future.cancel()
+        self._pending.clear()
+
+    def stats(self):
+        return {
+            "queue_depth": len(self._pending),
+            "in_flight": self._outstanding - len(self._pending),
+            "max_pending": self.max_pending,
+            "max_batch_size": self.max_batch_size,
+            "window_ms": self.window * 1000,
+            "batches": self.batches,
+            "items": self.items,
+            "rejected": self.rejected,
+            "avg_batch_size": self.items / self.batches if self.batches else 0.0,
+            "largest_batch": self.largest_batch,
+            "avg_wait_ms": self.total_wait / self.items * 1000 if self.items else 0.0,
+            "max_wait_ms": self.max_wait * 1000,
+        }
@@ -0,0 +1,111 @@
+import json
+import os
+
+from cache.local import MISS, LocalCache
+
+try:
+    from PIL import Image
+except ImportError:  # perceptual matching is skipped without Pillow
+    Image = None
+
+# Classifications are a pure function of the image, so they can live long
+FOOD_CACHE_TTL = int(os.getenv("FOOD_CACHE_TTL", str(7 * 24 * 3600)))
+FOOD_LOCAL_CACHE_SIZE = int(os.getenv("FOOD_LOCAL_CACHE_SIZE", "2048"))
+# Also match re-encoded / resized copies of a photo by a 64-bit difference hash. Off by
+# default: it costs a decode per new upload, and two different meals that look alike
+# at 9x8 pixels share a result.
+FOOD_PERCEPTUAL_HASH = os.getenv("FOOD_PERCEPTUAL_HASH", "0") == "1" and Image is not None
+
+
+def digest_key(digest):
+    return f"food:sha256:{digest}"
+
+
+def phash_key(phash):
+    return f"food:dhash:{phash}"
+
+
+def perceptual_hash(path):
+    # dHash: compare neighbouring pixels of a 9x8 grayscale thumbnail. Returns None
+    # when disabled or when the bytes are not a decodable image.
+    if not FOOD_PERCEPTUAL_HASH:
+        return None
+    try:
+        with Image.open(path) as image:
+            image.draft("L", (64, 64))  # JPEG: decode at reduced scale
+            pixels = list(image.convert("L").resize((9, 8)).getdata())
+    except Exception:
+        return None
+    bits = 0
+    for row in range(8):
+        for col in range(8):
+            bits = bits << 1 | (pixels[row * 9 + col] > pixels[row * 9 + col + 1])
+    return f"{bits:016x}"
+
+
+class ClassificationCache:
+    """Two-tier (in-process LRU, then Redis) cache of results keyed by image hash.
+
+    With redis_client=None only the in-process tier is used.
+    """
+
+    def __init__(self, redis_client, ttl=FOOD_CACHE_TTL, local=None):
+        self.redis = redis_client
+        self.ttl = ttl
+        self.local = local if local is not None else LocalCache(maxsize=FOOD_LOCAL_CACHE_SIZE, ttl=ttl)
+        self.local_hits = 0
+        self.redis_hits = 0
+        self.perceptual_hits = 0
+        self.misses = 0
+
+    async def get(self, digest, phash=None):
+        # (result or None, perceptual hash or None). The exact digest is looked up first;
+        # `phash`, an async callable giving the perceptual hash, only runs when it misses.
+        value = await self._find(digest_key(digest))
+        hashed = None
+        if value is None and phash is not None and FOOD_PERCEPTUAL_HASH:
+            hashed = await phash()
+            if hashed:
+                value = await self._find(phash_key(hashed))
+                self.perceptual_hits += value is not None
+        self.misses += value is None
+        return value, hashed
+
+    async def _find(self, key):
+        value = self.local.get(key)
+        if value is not MISS:
+            self.local_hits += 1
+            return value
+        cached = await self.redis.get(key) if self.redis is not None else None
+        if cached is None:
+            return None
+        value = json.loads(cached)
+        self.local.set(key, value)
+        self.redis_hits += 1
+        return value
+
+    async def set(self, digest, phash, result):
+        keys = [digest_key(digest)] + ([phash_key(phash)] if phash else [])
+        for key in keys:
+            self.local.set(key, result)
+        if self.redis is None:
+            return
+        async with self.redis.pipeline(transaction=False) as pipe:
+            for key in keys:
+                pipe.set(key, json.dumps(result), ex=self.ttl)
+            await pipe.execute()
+
+    def stats(self):
+        hits = self.local_hits + self.redis_hits
+        lookups = hits + self.misses
+        return {
+            "lookups": lookups,
+            "hits": hits,
+            "local_hits": self.local_hits,
+            "redis_hits": self.redis_hits,
+            "perceptual_hits": self.perceptual_hits,
+            "misses": self.misses,
+            "hit_ratio": hits / lookups if lookups else 0.0,
+            "perceptual_hash": FOOD_PERCEPTUAL_HASH,
+            "local": self.local.stats(),
+        }
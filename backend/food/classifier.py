@@ -0,0 +1,55 @@
+import importlib
+import os
+
+# "module:callable" returning a classifier; empty means the local stand-in
+FOOD_CLASSIFIER = os.getenv("FOOD_CLASSIFIER", "")
+
+# Healthy score (0-10) reported for each label, used for MealActivity.healthy_score
+HEALTHY_SCORES = {
+    "salad": 9,
+    "fruit": 9,
+    "vegetables": 9,
+    "sushi": 7,
+    "pasta": 5,
+    "sandwich": 5,
+    "burger": 3,
+    "pizza": 3,
+    "fries": 2,
+    "dessert": 1,
+}
+
+
+class Classifier:
+    """Interface for meal classifiers. Runs inside the inference worker processes."""
+
+    labels = list(HEALTHY_SCORES)
+
+    def classify_batch(self, batch):
+        # batch: (N, H, W, 3) uint8 array from food.preprocess -> N x {"label", "confidence"}
+        raise NotImplementedError
+
+
+class PixelStatsClassifier(Classifier):
+    """Deterministic stand-in: picks a label from simple pixel statistics.
+
+    Good enough to exercise the upload/inference path offline; swap in a real
+    model with FOOD_CLASSIFIER=package.module:factory.
+    """
+
+    def classify_batch(self, batch):
+        means = batch.reshape(len(batch), -1).mean(axis=1)
+        return [
+            {"label": self.labels[int(mean) % len(self.labels)], "confidence": round(1 - float(mean % 1) / 2, 3)}
+            for mean in means
+        ]
+
+
+def load_classifier(spec=FOOD_CLASSIFIER):
+    if not spec:
+        return PixelStatsClassifier()
+    module_name, _, attr = spec.partition(":")
+    return getattr(importlib.import_module(module_name), attr)()
+
+
+def with_scores(result):
+    return {**result, "healthy_score": HEALTHY_SCORES.get(result["label"], 5)}
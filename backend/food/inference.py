@@ -0,0 +1,79 @@
+import asyncio
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+from food.cache import perceptual_hash
+from food.classifier import FOOD_CLASSIFIER, load_classifier, with_scores
+from food.preprocess import preprocess_batch
+
+# CPU-bound classification runs in worker processes so it never blocks the event loop.
+# Every uvicorn worker has its own pool, so by default the cores are split between them
+# (WEB_CONCURRENCY is uvicorn's worker count) rather than each taking all of them.
+WEB_CONCURRENCY = int(os.getenv("WEB_CONCURRENCY", "1"))
+FOOD_WORKERS = int(os.getenv("FOOD_WORKERS", "0")) or max((os.cpu_count() or 1) // WEB_CONCURRENCY, 1)
+# Start every worker (and load the classifier) at app startup rather than on the first photo
+FOOD_WARMUP = os.getenv("FOOD_WARMUP", "1") == "1"
+
+_pool = None
+
+# Set in each worker process by _init_worker
+_classifier = None
+
+
+def _init_worker(spec):
+    global _classifier
+    _classifier = load_classifier(spec)
+
+
+def _ready():
+    return _classifier is not None
+
+
+def _classify_files(paths):
+    # Only paths cross the process boundary: decoding, resizing and inference all
+    # happen here, and the batch array never leaves this worker. None marks a file
+    # that is not a readable image.
+    batch, decoded = preprocess_batch(paths)
+    results = [None] * len(paths)
+    if decoded:
+        for i, result in zip(decoded, _classifier.classify_batch(batch)):
+            results[i] = with_scores(result)
+    return results
+
+
+def get_pool():
+    global _pool
+    if _pool is None:
+        # spawn, not fork: the API process holds driver threads and sockets a child must not inherit
+        _pool = ProcessPoolExecutor(
+            max_workers=FOOD_WORKERS,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=_init_worker,
+            initargs=(FOOD_CLASSIFIER,),
+        )
+    return _pool
+
+
+async def classify_files(paths):
+    return await asyncio.get_running_loop().run_in_executor(get_pool(), _classify_files, paths)
+
+
+async def hash_file(path):
+    # The perceptual hash decodes the image too, so it runs in the workers as well
+    return await asyncio.get_running_loop().run_in_executor(get_pool(), perceptual_hash, path)
+
+
+async def warm_pool():
+    # One call per worker; the pool spawns processes on demand, so concurrent calls start them all
+    if not FOOD_WARMUP:
+        return
+    loop = asyncio.get_running_loop()
+    await asyncio.gather(*(loop.run_in_executor(get_pool(), _ready) for _ in range(FOOD_WORKERS)))
+
+
+def shutdown_pool():
+    global _pool
+    if _pool is not None:
+        _pool.shutdown(wait=False, cancel_futures=True)
+        _pool = None
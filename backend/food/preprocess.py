@@ -0,0 +1,35 @@
+import os
+
+import numpy as np
+from PIL import Image, ImageOps
+
+# Side of the square RGB input the classifier expects
+FOOD_INPUT_SIZE = int(os.getenv("FOOD_INPUT_SIZE", "224"))
+
+
+def load_image(path, size=FOOD_INPUT_SIZE):
+    # Decodes straight from the spooled file. draft() lets the JPEG decoder scale
+    # by 1/2..1/8 during decoding, so a 12MP photo is never materialized in full.
+    with Image.open(path) as image:
+        image.draft("RGB", (size, size))
+        image = ImageOps.exif_transpose(image)
+        return ImageOps.fit(image.convert("RGB"), (size, size), Image.Resampling.BILINEAR)
+
+
+def preprocess_batch(paths, size=FOOD_INPUT_SIZE):
+    """Decodes paths into one C-contiguous (N, size, size, 3) uint8 array.
+
+    Each image is written straight into its slot of the preallocated batch.
+    Returns (batch, indices of the paths that decoded); unreadable files are
+    left out of the batch.
+    """
+    batch = np.empty((len(paths), size, size, 3), dtype=np.uint8)
+    decoded = []
+    for i, path in enumerate(paths):
+        try:
+            image = load_image(path, size)
+        except (OSError, ValueError, Image.DecompressionBombError):
+            continue
+        batch[len(decoded)] = np.asarray(image)
+        decoded.append(i)
+    return batch[:len(decoded)], decoded
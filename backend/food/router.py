@@ -0,0 +1,62 @@
+import asyncio
+import logging
+import os
+
+from fastapi import APIRouter, HTTPException, Request
+
+from cache.client import redis_client
+from food.batcher import MicroBatcher, Overloaded
+from food.cache import ClassificationCache
+from food.inference import FOOD_WORKERS, classify_files, hash_file
+from food.upload import receive_file
+
+router = APIRouter()
+
+# One batch per worker process can be in flight; the rest wait and grow the next batch
+batcher = MicroBatcher(classify_files, max_concurrent_batches=FOOD_WORKERS)
+
+# Re-uploads of the same (or, with FOOD_PERCEPTUAL_HASH, a re-encoded) photo are
+# answered without inference
+classifications = ClassificationCache(redis_client)
+
+
+async def classify(path, digest):
+    # An exact re-upload is answered from its digest without decoding the image
+    result, phash = await classifications.get(digest, lambda: hash_file(path))
+    if result is None:
+        result = await batcher.submit(path)
+        if result is not None:
+            await classifications.set(digest, phash, result)
+    return result
+
+
+@router.post("/analyse-food")
+async def analyse_food(request: Request):
+    # Refuse before reading the upload when the inference queue is already full
+    if batcher.full():
+        raise HTTPException(status_code=503, detail="Meal classification is busy, try again shortly", headers={"Retry-After": "1"})
+
+    # Multipart upload with a single `file` field, as sent by the camera tab
+    path, digest = await receive_file(request, field="file")
+    try:
+        result = await classify(path, digest)
+    except Overloaded:
+        raise HTTPException(status_code=503, detail="Meal classification is busy, try again shortly", headers={"Retry-After": "1"})
+    except Exception as e:
+        logging.error(f"Error classifying meal: {e}")
+        raise HTTPException(status_code=500, detail=f"Error classifying meal: {e}")
+    finally:
+        await asyncio.to_thread(os.unlink, path)
+
+    if result is None:
+        raise HTTPException(status_code=400, detail="Upload is not a readable image")
+    return {
+        "classification": result["label"],
+        "confidence": result["confidence"],
+        "healthy_score": result["healthy_score"],
+    }
+
+
+@router.get("/analyse-food/stats")
+async def get_food_stats():
+    return {"batcher": batcher.stats(), "cache": classifications.stats()}
@@ -0,0 +1,114 @@
+import asyncio
+import hashlib
+import os
+import tempfile
+
+from fastapi import HTTPException
+from python_multipart.multipart import MultipartParser, parse_options_header
+
+# Largest meal photo accepted, in bytes
+MAX_UPLOAD_BYTES = int(os.getenv("MAX_UPLOAD_BYTES", str(10 * 1024 * 1024)))
+
+
+class _FilePart:
+    # Collects the target field's bytes from the parser callbacks for one network chunk at a time
+
+    def __init__(self, field, max_bytes):
+        self.field = field
+        self.max_bytes = max_bytes
+        self.size = 0
+        self.found = False
+        self.pending = []
+        self._header_name = b""
+        self._header_value = b""
+        self._disposition = b""
+        self._active = False
+
+    def callbacks(self):
+        return {
+            "on_part_begin": self.on_part_begin,
+            "on_header_field": self.on_header_field,
+            "on_header_value": self.on_header_value,
+            "on_header_end": self.on_header_end,
+            "on_headers_finished": self.on_headers_finished,
+            "on_part_data": self.on_part_data,
+        }
+
+    def on_part_begin(self):
+        self._disposition = b""
+        self._active = False
+
+    def on_header_field(self, data, start, end):
+        self._header_name += data[start:end]
+
+    def on_header_value(self, data, start, end):
+        self._header_value += data[start:end]
+
+    def on_header_end(self):
+        if self._header_name.lower() == b"content-disposition":
+            self._disposition = self._header_value
+        self._header_name = b""
+        self._header_value = b""
+
+    def on_headers_finished(self):
+        _, options = parse_options_header(self._disposition)
+        self._active = options.get(b"name") == self.field.encode() and not self.found
+        self.found = self.found or self._active
+
+    def on_part_data(self, data, start, end):
+        if not self._active:
+            return
+        self.size += end - start
+        if self.size > self.max_bytes:
+            raise HTTPException(status_code=413, detail=f"Image larger than {self.max_bytes} bytes")
+        self.pending.append(bytes(data[start:end]))
+
+
+async def receive_file(request, field="file", max_bytes=MAX_UPLOAD_BYTES):
+    """Streams one multipart file field to a temporary file.
+
+    Returns (path, sha256 hex digest of the file bytes).
+
+    The body is consumed chunk by chunk and rejected as soon as it passes
+    max_bytes, so the event loop never holds more than one chunk of the image.
+    The caller owns (and must delete) the returned file.
+    """
+    content_length = request.headers.get("content-length")
+    if content_length and int(content_length) > max_bytes + 64 * 1024:  # room for multipart framing
+        raise HTTPException(status_code=413, detail=f"Image larger than {max_bytes} bytes")
+
+    _, params = parse_options_header(request.headers.get("content-type", ""))
+    if b"boundary" not in params:
+        raise HTTPException(status_code=400, detail="Expected a multipart/form-data upload")
+
+    part = _FilePart(field, max_bytes)
+    digest = hashlib.sha256()
+    parser = MultipartParser(params[b"boundary"], part.callbacks())
+    f = await asyncio.to_thread(tempfile.NamedTemporaryFile, prefix="meal-", delete=False)
+    try:
+        async for chunk in request.stream():
+            parser.write(chunk)
+            if part.pending:
+                await asyncio.to_thread(_write, f, digest, b"".join(part.pending))
+                part.pending.clear()
+        parser.finalize()
+        await asyncio.to_thread(f.close)
+    except BaseException:
+        await asyncio.to_thread(_discard, f)
+        raise
+
+    if not part.found or part.size == 0:
+        await asyncio.to_thread(os.unlink, f.name)
+        raise HTTPException(status_code=400, detail=f"Missing '{field}' file field")
+    return f.name, digest.hexdigest()
+
+
+def _write(f, digest, data):
+    # Hashed off the event loop, alongside the write
+    digest.update(data)
+    f.write(data)
+
+
+def _discard(f):
+    f.close()
+    os.unlink(f.name)
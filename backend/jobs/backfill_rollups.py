@@ -0,0 +1,110 @@
+"""Builds the day/week/month activity rollups from activity_history.
+
+Safe to re-run: each counter is moved by the difference between the value
+computed from history and its current value, never reset.
+
+Run from the backend directory:
+    python -m jobs.backfill_rollups [--user 42] [--page-size 500]
+"""
+import argparse
+import asyncio
+import logging
+from collections import defaultdict
+from datetime import date
+
+import rollups
+from cache.client import close_redis, redis_client
+from db.async_session import AsyncSession
+from db.connection import KEYSPACE, connect
+from db.rows import meals_from_row
+from db.statements import StatementRegistry
+
+
+def _day(value):
+    return date.fromisoformat(str(value))
+
+
+async def backfill_user(db, statements, user_id, first_year, last_year):
+    totals = defaultdict(lambda: defaultdict(float))  # (period, start) -> metric -> amount
+    results = await db.execute_many(
+        (statements["select_history_year"], (user_id, year)) for year in range(first_year, last_year + 1)
+    )
+    for rows in results:
+        for row in rows:
+            amounts = rollups.contribution({
+                "exercise_duration": row.exercise_duration,
+                "meals": meals_from_row(row),
+            })
+            if row.sleep_hours is not None:
+                amounts.update(sleep_hours=row.sleep_hours, nights=1)
+            day = _day(row.date)
+            for period in rollups.PERIODS:
+                for metric, amount in amounts.items():
+                    totals[(period, rollups.period_start(period, day))][metric] += amount
+
+    current = {}
+    results = await db.execute_many(
+        (statements["select_all_rollups"], (user_id, period)) for period in rollups.PERIODS
+    )
+    for period, rows in zip(rollups.PERIODS, results):
+        for row in rows:
+            current[(period, _day(row.period_start))] = rollups.from_counters(row)
+
+    updates = []
+    for period, start in set(totals) | set(current):
+        change = rollups.delta(current.get((period, start), {}), totals.get((period, start), {}))
+        params = rollups.counter_params(change)
+        if any(params):
+            updates.append(((period, start), (statements["increment_rollup"], params + (user_id, period, start))))
+    if not updates:
+        return 0
+
+    await db.execute_many(statement for _, statement in updates)
+    # Cached hashes were built from the old counters
+    await redis_client.delete(*(rollups.rollup_key(user_id, period, start) for (period, start), _ in updates))
+    return len(updates)
+
+
+async def _user_pages(db, statements, page_size, user_id):
+    if user_id is not None:
+        yield list(await db.execute(statements["select_user_created"], (user_id,)))
+        return
+    async for rows in db.iter_pages(statements["scan_users"], fetch_size=page_size):
+        yield rows
+
+
+async def backfill_all(db, statements, page_size=500, user_id=None):
+    this_year = date.today().year
+    users = 0
+    fixed = 0
+    async for rows in _user_pages(db, statements, page_size, user_id):
+        counts = await asyncio.gather(*(
+            backfill_user(db, statements, row.id, row.created_at.year if row.created_at else this_year, this_year)
+            for row in rows
+        ))
+        users += len(rows)
+        fixed += sum(counts)
+        logging.info(f"Backfilled {users} users, {fixed} rollup rows changed")
+    return users, fixed
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--user", type=int, default=None, help="only backfill this user id")
+    parser.add_argument("--page-size", type=int, default=500)
+    args = parser.parse_args()
+
+    cluster, session = connect()
+    try:
+        db = AsyncSession(session)
+        statements = StatementRegistry(session, KEYSPACE)
+        await statements.prepare_all()
+        await backfill_all(db, statements, args.page_size, args.user)
+    finally:
+        await close_redis()
+        cluster.shutdown()
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    asyncio.run(main())
@@ -0,0 +1,141 @@
+"""Repopulates the Redis leaderboards from petspace and friend_group_member.
+
+The boards are built under temporary keys and renamed into place at the end, so
+readers keep seeing the previous boards until the new ones are complete. Writes
+ranked while the job runs land on the previous boards, which the rename drops, so
+pets updated since the scan started are ranked again afterwards and every name
+is set again. Group joins and leaves during the run are not replayed: run the job
+when membership is quiet, or run it again.
+
+Run from the backend directory:
+    python -m jobs.rebuild_leaderboards [--page-size 1000]
+"""
+import argparse
+import asyncio
+import logging
+from time import perf_counter
+
+import decay
+import leaderboard
+from cache.client import close_redis, pipeline, redis_client
+from db.async_session import AsyncSession
+from db.connection import KEYSPACE, connect
+from db.statements import StatementRegistry
+
+BUILD_PREFIX = "leaderboard:rebuild:"
+
+
+def _building(key):
+    return BUILD_PREFIX + key
+
+
+async def load_pets(db, statements, page_size):
+    # Global board and pet names, one pipelined round trip per page
+    total = 0
+    started = perf_counter()
+    async for rows in db.iter_pages(statements["scan_pet_happiness"], fetch_size=page_size):
+        async with pipeline() as pipe:
+            scores = {row.pet_id: leaderboard.score(row.happiness, row.stats_updated_at) for row in rows if row.happiness is not None}
+            if scores:
+                pipe.zadd(_building(leaderboard.GLOBAL_KEY), scores)
+                pipe.hset(_building(leaderboard.NAMES_KEY), mapping={row.pet_id: row.pet_name or "" for row in rows if row.pet_id in scores})
+            await pipe.execute()
+        total += len(scores)
+        logging.info(f"Ranked {total} pets ({total / (perf_counter() - started):.0f}/s)")
+    return total
+
+
+async def load_groups(db, statements, page_size):
+    # Group boards take each member's score from the global board just built
+    group_ids = set()
+    async for rows in db.iter_pages(statements["scan_group_members"], fetch_size=page_size):
+        async with pipeline() as pipe:
+            for row in rows:
+                pipe.zscore(_building(leaderboard.GLOBAL_KEY), row.user_id)
+            scores = await pipe.execute()
+        async with pipeline() as pipe:
+            for row, score in zip(rows, scores):
+                if score is not None:
+                    pipe.zadd(_building(leaderboard.group_key(row.group_id)), {row.user_id: score})
+                    group_ids.add(row.group_id)
+            await pipe.execute()
+    return group_ids
+
+
+async def swap_in(group_ids):
+    keys = [leaderboard.GLOBAL_KEY, leaderboard.NAMES_KEY] + [leaderboard.group_key(group_id) for group_id in group_ids]
+    # Boards of groups that have no ranked members any more
+    stale = [key async for key in redis_client.scan_iter(match=leaderboard.group_key("*")) if key not in keys]
+    async with pipeline() as pipe:
+        for key in keys:
+            pipe.exists(_building(key))
+        built = await pipe.execute()
+    # All boards switch over together
+    async with redis_client.pipeline(transaction=True) as pipe:
+        for key, exists in zip(keys, built):
+            if exists:
+                pipe.rename(_building(key), key)
+            else:  # an empty board has nothing to rename
+                pipe.delete(key)
+        if stale:
+            pipe.delete(*stale)
+        await pipe.execute()
+
+
+async def replay(db, statements, since, page_size):
+    # Pets whose stats changed after `since` were ranked on the boards swap_in replaced;
+    # they go back on the live boards (global and their groups'), and names are set
+    # again for renames made during the run
+    total = 0
+    async for rows in db.iter_pages(statements["scan_pet_happiness"], fetch_size=page_size):
+        ranked = [row for row in rows if row.happiness is not None]
+        changed = [row for row in ranked if row.stats_updated_at and decay.parse(row.stats_updated_at) >= since]
+        groups = await db.execute_many((statements["select_user_groups"], (row.pet_id,)) for row in changed)
+        async with pipeline() as pipe:
+            if ranked:
+                pipe.hset(leaderboard.NAMES_KEY, mapping={row.pet_id: row.pet_name or "" for row in ranked})
+            for row, group_rows in zip(changed, groups):
+                score = leaderboard.score(row.happiness, row.stats_updated_at)
+                pipe.zadd(leaderboard.GLOBAL_KEY, {row.pet_id: score})
+                for group_row in group_rows:
+                    pipe.zadd(leaderboard.group_key(group_row.group_id), {row.pet_id: score})
+            await pipe.execute()
+        total += len(changed)
+    if total:
+        logging.info(f"Ranked {total} pets again that changed during the rebuild")
+    return total
+
+
+async def rebuild(db, statements, page_size=1000):
+    build_keys = [key async for key in redis_client.scan_iter(match=BUILD_PREFIX + "*")]
+    if build_keys:
+        # Leftovers of an interrupted run
+        await redis_client.delete(*build_keys)
+    started = decay.now()
+    total = await load_pets(db, statements, page_size)
+    group_ids = await load_groups(db, statements, page_size)
+    await swap_in(group_ids)
+    await replay(db, statements, started, page_size)
+    return total, len(group_ids)
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--page-size", type=int, default=1000)
+    args = parser.parse_args()
+
+    cluster, session = connect()
+    try:
+        db = AsyncSession(session)
+        statements = StatementRegistry(session, KEYSPACE)
+        await statements.prepare_all()
+        total, groups = await rebuild(db, statements, args.page_size)
+        logging.info(f"Done, {total} pets ranked across the global board and {groups} friend groups")
+    finally:
+        await close_redis()
+        cluster.shutdown()
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    asyncio.run(main())
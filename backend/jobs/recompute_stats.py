@@ -0,0 +1,110 @@
+"""Recomputes pet stats for every user from their current activity row.
+
+Run from the backend directory:
+    python -m jobs.recompute_stats [--page-size 1000] [--as-of 2025-01-01T08:00:00]
+"""
+import argparse
+import asyncio
+import logging
+from datetime import datetime
+from time import perf_counter
+
+import leaderboard
+from cache.client import close_redis, pipeline
+from cache.local import queue_invalidation
+from db.async_session import AsyncSession
+from db.connection import KEYSPACE, connect
+from db.rows import meals_from_row
+from db.statements import StatementRegistry
+from scoring import columns_for, score
+
+
+async def recompute_page(db, statements, rows, wake_time):
+    activities = [{
+        "activity_id": row.activity_id,
+        "sleep_time": row.sleep_time,
+        "exercise_duration": row.exercise_duration,
+        "meals": meals_from_row(row),
+    } for row in rows]
+
+    # Goals for the whole page, fetched concurrently as single-partition reads
+    results = await db.execute_many(
+        (statements["select_pet_goals"], (activity["activity_id"],)) for activity in activities
+    )
+    matched = [(activity, result.one()) for activity, result in zip(activities, results)]
+    matched = [(activity, pet._asdict()) for activity, pet in matched if pet is not None]
+    if not matched:
+        return 0
+
+    activities, pets = zip(*matched)
+    stats = score(**columns_for(activities, pets, wake_time))
+    # The recomputed stats start decaying from the as-of time (see decay.py)
+    stats_updated_at = wake_time.astimezone()
+
+    await db.execute_many(
+        (statements["update_pet_stats"], (
+            int(stats["happiness"][i]),
+            int(stats["diet"][i]),
+            int(stats["exercise"][i]),
+            int(stats["sleep"][i]),
+            stats_updated_at,
+            pet["pet_id"],
+        ))
+        for i, pet in enumerate(pets)
+    )
+
+    # Group memberships for the leaderboards, fetched like the goals
+    groups = await db.execute_many(
+        (statements["select_user_groups"], (pet["pet_id"],)) for pet in pets
+    )
+    scores = {
+        pet["pet_id"]: leaderboard.score(int(stats["happiness"][i]), stats_updated_at)
+        for i, pet in enumerate(pets)
+    }
+
+    # Cached pets (and the versions they carry) are now stale; drop them everywhere and
+    # move the pets on the leaderboards, in one round trip
+    keys = [f"pet_stats:{pet_id}" for pet_id in scores]
+    async with pipeline() as pipe:
+        pipe.delete(*keys)
+        queue_invalidation(pipe, *keys)
+        pipe.zadd(leaderboard.GLOBAL_KEY, scores)
+        for pet_id, rows in zip(scores, groups):
+            for row in rows:
+                pipe.zadd(leaderboard.group_key(row.group_id), {pet_id: scores[pet_id]})
+        await pipe.execute()
+
+    return len(pets)
+
+
+async def recompute_all(db, statements, wake_time, page_size=1000):
+    total = 0
+    started = perf_counter()
+    async for rows in db.iter_pages(statements["scan_activities"], fetch_size=page_size):
+        total += await recompute_page(db, statements, rows, wake_time)
+        logging.info(f"Recomputed {total} pets ({total / (perf_counter() - started):.0f}/s)")
+    return total
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--page-size", type=int, default=1000)
+    parser.add_argument("--as-of", type=datetime.fromisoformat, default=None,
+                        help="wake time used for sleep duration (default: now)")
+    args = parser.parse_args()
+
+    cluster, session = connect()
+    try:
+        db = AsyncSession(session)
+        statements = StatementRegistry(session, KEYSPACE)
+        await statements.prepare_all()
+        total = await recompute_all(db, statements, args.as_of or datetime.now(), args.page_size)
+        logging.info(f"Done, {total} pets updated")
+    finally:
+        await close_redis()
+        cluster.shutdown()
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    asyncio.run(main())
@@ -0,0 +1,90 @@
+import math
+from datetime import datetime, timezone
+
+import decay
+
+# Happiness rankings kept in Redis sorted sets: one global board and one per friend group,
+# updated whenever a write changes a pet's happiness, so top-K and rank lookups are
+# O(log n) however many users there are. Happiness decays at the same rate for every pet
+# (decay.py), so each pet is scored by its happiness extrapolated back to a fixed epoch:
+# ordering by that score is ordering by current happiness, at any time, without rewrites.
+EPOCH = datetime(2025, 1, 1, tzinfo=timezone.utc)
+
+GLOBAL_KEY = "leaderboard:global"
+NAMES_KEY = "leaderboard:names"  # user_id -> pet name, for display
+
+MAX_TOP = 100
+MAX_RADIUS = 25
+
+
+def group_key(group_id):
+    return f"leaderboard:group:{group_id}"
+
+
+def board_key(group_id=None):
+    return GLOBAL_KEY if group_id is None else group_key(group_id)
+
+
+def _hours(moment):
+    return (moment - EPOCH).total_seconds() / 3600
+
+
+def score(happiness, stats_updated_at):
+    # Pets without stats_updated_at (stored before decay) are ranked as if updated now
+    updated_at = decay.parse(stats_updated_at) or decay.now()
+    return happiness + decay.DECAY_PER_HOUR["happiness"] * _hours(updated_at)
+
+
+def happiness(score, at=None):
+    # Current happiness for a score, the same value decay.current() gives for the pet
+    value = score - decay.DECAY_PER_HOUR["happiness"] * _hours(at or decay.now())
+    return max(math.ceil(round(value, 6)), 0)
+
+
+async def record(redis_client, pet, group_ids):
+    # The pet's score on the global board and on each of its groups' boards, in one round trip
+    user_id = pet["pet_id"]
+    pet_score = score(pet["happiness"], pet.get("stats_updated_at"))
+    async with redis_client.pipeline(transaction=False) as pipe:
+        for key in [GLOBAL_KEY] + [group_key(group_id) for group_id in group_ids]:
+            pipe.zadd(key, {user_id: pet_score})
+        pipe.hset(NAMES_KEY, user_id, pet["pet_name"] or "")
+        await pipe.execute()
+
+
+async def join(redis_client, group_id, user_id):
+    # Members enter their group's board with the score they already have globally
+    pet_score = await redis_client.zscore(GLOBAL_KEY, user_id)
+    if pet_score is not None:
+        await redis_client.zadd(group_key(group_id), {user_id: pet_score})
+
+
+async def leave(redis_client, group_id, user_id):
+    await redis_client.zrem(group_key(group_id), user_id)
+
+
+async def _entries(redis_client, members, first_rank):
+    names = await redis_client.hmget(NAMES_KEY, [member for member, _ in members]) if members else []
+    at = decay.now()
+    return [{
+        "rank": first_rank + i,
+        "user_id": int(member),
+        "pet_name": name,
+        "happiness": happiness(member_score, at),
+    } for i, ((member, member_score), name) in enumerate(zip(members, names))]
+
+
+async def top(redis_client, group_id, k):
+    members = await redis_client.zrevrange(board_key(group_id), 0, k - 1, withscores=True)
+    return await _entries(redis_client, members, 1)
+
+
+async def around(redis_client, group_id, user_id, radius):
+    # The user's 1-based rank and the `radius` entries either side of it; None when unranked
+    key = board_key(group_id)
+    rank = await redis_client.zrevrank(key, user_id)
+    if rank is None:
+        return None
+    first = max(rank - radius, 0)
+    members = await redis_client.zrevrange(key, first, rank + radius, withscores=True)
+    return {"rank": rank + 1, "entries": await _entries(redis_client, members, first + 1)}
@@ -1,49 +1,38 @@
+from contextlib import asynccontextmanager
 from datetime import datetime, time, date, timedelta
 import logging
-import shutil
-from typing import List, Optional
-import uuid
-from fastapi import FastAPI, HTTPException, File, UploadFile
+from collections import defaultdict
+from typing import List, Literal, Optional
+from fastapi import APIRouter, FastAPI, HTTPException, Query, Request, Response
 from fastapi.middleware.cors import CORSMiddleware
 from pydantic import BaseModel
-from fastapi.responses import JSONResponse
-from cassandra.cluster import Cluster
-from cassandra.auth import PlainTextAuthProvider
-import json
-import redis 
-
-# Load environment variables
-app = FastAPI()
-# Connect to Redis server
-redis_client = redis.StrictRedis(host="localhost", port=6379, db=0, decode_responses=True)
-
-
-# Setup Cassandra connection
-cloud_config = {
-    'secure_connect_bundle': 'secure-connect-pet-db.zip'
-}
-
-with open("token.json") as f:
-    secrets = json.load(f)
-
-CLIENT_ID = secrets["clientId"]
-CLIENT_SECRET = secrets["secret"]
-
-auth_provider = PlainTextAuthProvider(CLIENT_ID, CLIENT_SECRET)
-cluster = Cluster(cloud=cloud_config, auth_provider=auth_provider)
-session = cluster.connect()
-
-# Define the keyspace
-keyspace = "pet"
-
-# Configure CORS
-app.add_middleware(
-    CORSMiddleware,
-    allow_origins=["*"],  # In production, replace with specific origins 
-    allow_credentials=True,
-    allow_methods=["*"],
-    allow_headers=["*"],
-)
+from fastapi.responses import PlainTextResponse
+import asyncio
+
+from cache import versions
+import decay
+from food.inference import shutdown_pool, warm_pool
+from food.router import batcher as food_batcher, classifications, router as food_router
+import leaderboard
+import metrics
+from push.router import hub as push_hub, router as push_router
+import rollups
+from scoring import score_one
+from serialization import JSONBytesResponse, dumps, loads
+from storage.base import create_repository
+from timing import StageTimer
+
+# Users, pets and activities: Astra + Redis by default, or embedded SQLite with
+# STORAGE_BACKEND=local (see storage/base.py). Connections open in the app lifespan.
+repo = create_repository()
+
+# Latency per route / statement / Redis command, cache hit ratios and event-loop lag on
+# /metrics. METRICS_ENABLED=0 leaves every client and the request path unwrapped.
+if metrics.METRICS_ENABLED:
+    repo.instrument()
+    metrics.register_collector(lambda: metrics.record_cache("classification", classifications.stats()))
+
+router = APIRouter()
 
 class MealActivity(BaseModel):
     meal_name: str
@@ -89,36 +78,74 @@ class User(BaseModel): ## this is the input
     meal_per_day: int
 
 
-@app.post("/user")
+class PetPatch(BaseModel):
+    # Only the fields sent are written (PATCH /user/pet/{pet_id})
+    pet_name: Optional[str] = None
+    happiness: Optional[int] = None
+    diet: Optional[int] = None
+    exercise: Optional[int] = None
+    sleep: Optional[int] = None
+    exercise_dur: Optional[float] = None
+    wake_up_time: Optional[time] = None
+    sleep_time: Optional[time] = None
+    unhealthy_food_limit: Optional[int] = None
+    meal_per_day: Optional[int] = None
+
+
+class ActivityPatch(BaseModel):
+    # Fields that feed the rollups (exercise, meals, date) have their own endpoints,
+    # which know the previous value; these two can be written blind, null included
+    # (an activity has no wake or sleep time until one is logged)
+    wake_up_time: Optional[time] = None
+    sleep_time: Optional[time] = None
+
+
+def patch_fields(patch: BaseModel, nullable=()):
+    # Fields the client actually sent, in stored form (times as TEXT). An explicit null
+    # would be written as one, so it is refused for fields that are never empty.
+    fields = patch.dict(exclude_unset=True)
+    if not fields:
+        raise HTTPException(status_code=400, detail="Nothing to update")
+    nulls = sorted(name for name, value in fields.items() if value is None and name not in nullable)
+    if nulls:
+        raise HTTPException(status_code=422, detail=f"Fields cannot be null: {', '.join(nulls)}")
+    return {name: value.isoformat() if isinstance(value, time) else value for name, value in fields.items()}
+
+
+def pet_to_dict(pet_id: int, pet: PetStats):
+    return {
+        "pet_id": pet_id,
+        "pet_name": pet.pet_name,
+        "happiness": pet.happiness,
+        "diet": pet.diet,
+        "exercise": pet.exercise,
+        "sleep": pet.sleep,
+        "wake_up_time": str(pet.wake_up_time),  # Convert to string
+        "sleep_time": str(pet.sleep_time),
+        "exercise_dur": pet.exercise_dur,
+        "unhealthy_food_limit": pet.unhealthy_food_limit,
+        "meal_per_day": pet.meal_per_day,
+        "stats_updated_at": decay.stamp()  # the stats above are as of now
+    }
+
+
+def activity_to_dict(activity: DailyActivity):
+    return {
+        "activity_id": activity.activity_id,
+        "date": activity.date.isoformat() if activity.date else None,
+        "wake_up_time": activity.wake_up_time.isoformat() if activity.wake_up_time else None,
+        "sleep_time": activity.sleep_time.isoformat() if activity.sleep_time else None,
+        "exercise_duration": activity.exercise_duration,
+        "meals": [meal.dict() for meal in activity.meals] if activity.meals else []
+    }
+
+
+@router.post("/user")
 async def create_user_db(user: User):
-    try:
-        # Ensure the table exists
-        session.execute(f"""
-            CREATE TABLE IF NOT EXISTS {keyspace}.userspace (
-                id INT PRIMARY KEY,
-                username TEXT,
-                email TEXT,
-                created_at TIMESTAMP
-            );
-        """)
-
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Error creating table: {e}")
-    
-    logging.info("Table 'users' checked/created successfully.")
-
     try:
         create_at = datetime.now()
         # Insert the user into the database
-        session.execute(f"""
-            INSERT INTO {keyspace}.userspace (id, username, email, created_at)
-            VALUES (%s, %s, %s, %s)
-        """, (
-            user.id, 
-            user.username, 
-            user.email, 
-            create_at
-        ))
+        await repo.create_user(user.id, user.username, user.email, create_at)
 
         logging.info(f"User {user.id} created successfully")
 
@@ -145,44 +172,10 @@ async def create_user_db(user: User):
         )
 
          # Insert the pet into the database
-        session.execute(
-            f"""
-            CREATE TABLE IF NOT EXISTS {keyspace}.petspace (
-                pet_id INT PRIMARY KEY,
-                pet_name TEXT,
-                happiness INT,
-                diet INT,
-                exercise INT,
-                sleep INT,
-                exercise_dur FLOAT,
-                wake_up_time TEXT,
-                sleep_time TEXT,
-                unhealthy_food_limit INT,
-                meal_per_day INT
-            );
-            """
-        )
-
-        session.execute(
-            f"""
-            INSERT INTO {keyspace}.petspace 
-            (pet_id, pet_name, happiness, diet, exercise, sleep, exercise_dur, wake_up_time, sleep_time, unhealthy_food_limit, meal_per_day)
-            VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
-            """,
-            (
-                pet_stats.pet_id, 
-                pet_stats.pet_name, 
-                pet_stats.happiness, 
-                pet_stats.diet,
-                pet_stats.exercise,
-                pet_stats.sleep,
-                pet_stats.exercise_dur, 
-                str(pet_stats.wake_up_time),
-                str(pet_stats.sleep_time), 
-                pet_stats.unhealthy_food_limit, 
-                pet_stats.meal_per_day
-            )
-        )
+        pet_data = pet_to_dict(pet_stats.pet_id, pet_stats)
+        await repo.create_pet(pet_data)
+        await update_leaderboards(pet_data)
+        await notify(user.id, pet=pet_data)
         
         logging.info(f"Pet {pet_name} created for user {user.id} successfully")
     except Exception as e:
@@ -191,17 +184,6 @@ async def create_user_db(user: User):
     
     try:
         # set activity log 
-        session.execute(f"""
-            CREATE TABLE IF NOT EXISTS {keyspace}.activityspace (
-                activity_id INT PRIMARY KEY,
-                date DATE,
-                wake_up_time TEXT,  -- Store as string (ISO 8601 format) or INT (timestamp)
-                sleep_time TEXT,    -- Store as string (ISO 8601 format) or INT (timestamp)
-                exercise_duration FLOAT,  -- Float for exercise duration in hours or minutes
-                meals TEXT,  -- Store meals as a JSON string or use a list of maps/sets for structured data
-            );
-        """)
-
         daily_activity = DailyActivity(
             activity_id=user.id,
             date=date.today(),
@@ -211,21 +193,9 @@ async def create_user_db(user: User):
             meals=[]
         )
 
-        session.execute(
-            f"""
-            INSERT INTO {keyspace}.activityspace 
-            (activity_id, date, wake_up_time, sleep_time, exercise_duration, meals)
-            VALUES ( %s, %s, %s, %s, %s, %s)
-            """,
-            (
-                daily_activity.activity_id, 
-                daily_activity.date, 
-                daily_activity.wake_up_time if daily_activity.wake_up_time is not None else "",  # Default empty string
-                daily_activity.sleep_time if daily_activity.sleep_time is not None else "",  # Default empty string
-                daily_activity.exercise_duration,
-                json.dumps(daily_activity.meals)  # Default empty string
-            )
-        )
+        activity_data = activity_to_dict(daily_activity)
+        await repo.create_activity(activity_data)
+        await notify(user.id, activity=activity_data)
 
         return {"message": f"Pet {pet_name} created for user {user.id} successfully, Activity log {daily_activity.activity_id}"}
     except Exception as e:
@@ -233,180 +203,205 @@ async def create_user_db(user: User):
    
    
 
-@app.get("/user/{user_id}")
+# Ids per batch read
+MAX_BATCH_IDS = 100
+
+
+def entity_tag(version, at=None):
+    # The cached document's version (cache/versions.py), plus for decaying pets how many
+    # points each stat has lost, since the decayed body changes with those even without
+    # a write. None for documents cached without a version.
+    if not version:
+        return None
+    token, _, stats_updated_at = version.partition("@")
+    if stats_updated_at:
+        token += "." + "-".join(str(step) for step in decay.steps(stats_updated_at, at))
+    return f'"{token}"'
+
+
+def current_pet_json(version: str, pet_json: bytes, at: datetime):
+    # Stats as of `at`, decayed from the stored values; nothing is written. Until a
+    # whole point has worn off the stored stats are the current ones, and the cached
+    # bytes go out without a decode/encode round trip.
+    stats_updated_at = versions.stats_updated_at(version)
+    if version and (stats_updated_at is None or not any(decay.steps(stats_updated_at, at))):
+        return pet_json
+    return dumps(decay.current(loads(pet_json), at))
+
+
+def tag_headers(etag: Optional[str]):
+    return {"ETag": etag, "Cache-Control": "no-cache"} if etag else None
+
+
+def not_modified(request: Request, etag: Optional[str]):
+    # 304 for a matching If-None-Match, None otherwise
+    header = request.headers.get("if-none-match")
+    if header is None or etag is None:
+        return None
+    if etag in (tag.strip().removeprefix("W/") for tag in header.split(",")):
+        return Response(status_code=304, headers={"ETag": etag, "Cache-Control": "no-cache"})
+    return None
+
+
+def batch_ids(ids: List[int]):
+    ids = list(dict.fromkeys(ids))  # duplicates are read once
+    if len(ids) > MAX_BATCH_IDS:
+        raise HTTPException(status_code=400, detail=f"At most {MAX_BATCH_IDS} ids per request")
+    return ids
+
+
+# Batch reads are declared before /user/{user_id}, which would otherwise capture their paths
+@router.get("/user/pets")
+async def get_user_pets(ids: List[int] = Query(...)):
+    # Several pets in one call: one Redis MGET, concurrent Cassandra reads for the misses
+    ids = batch_ids(ids)
+    try:
+        pets = await repo.get_pets(ids)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error fetching pets: {e}")
+
+    at = decay.now()
+    return JSONBytesResponse(dumps({
+        "items": [decay.current(pet, at) for pet in pets if pet is not None],
+        "missing": [pet_id for pet_id, pet in zip(ids, pets) if pet is None],
+    }))
+
+
+@router.get("/user/activities")
+async def get_user_activities(ids: List[int] = Query(...)):
+    ids = batch_ids(ids)
+    try:
+        activities = await repo.get_activities(ids)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error fetching activities: {e}")
+
+    return JSONBytesResponse(dumps({
+        "items": [activity for activity in activities if activity is not None],
+        "missing": [activity_id for activity_id, activity in zip(ids, activities) if activity is None],
+    }))
+
+
+@router.get("/user/{user_id}")
 async def get_user(user_id: int):
-    query = "SELECT id, username, email FROM pet.userspace WHERE id = %s"  # Avoid f-string for query
     try:
-        row = session.execute(query, (user_id,)).one()
-
-        if row:
-            return {
-                "id": row.id,
-                "username": row.username,  # Corrected from 'name' to 'username'
-                "email": row.email,
-            }
-        else:
-            raise HTTPException(status_code=404, detail="User not found")
+        # Cached JSON bytes go straight out, without a decode/encode round trip
+        user_json = await repo.get_user_json(user_id)
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error fetching user: {e}")
 
+    if user_json is None:
+        raise HTTPException(status_code=404, detail="User not found")
+    return JSONBytesResponse(user_json)
 
-@app.get('/user/pet/{pet_id}')
-async def get_user_pet(pet_id: int):
-    
+
+@router.get('/user/pet/{pet_id}')
+async def get_user_pet(pet_id: int, request: Request):
+    at = decay.now()
     try:
-        # Ensure `wake_goal` exists in the database or replace it with `wake_up_time`
-        pet_query = """
-            SELECT pet_id, pet_name, happiness, diet, exercise, sleep,
-                   wake_up_time, sleep_time, exercise_dur, unhealthy_food_limit, meal_per_day
-            FROM pet.petspace WHERE pet_id = %s
-        """
-        pet_row = session.execute(pet_query, (pet_id,)).one()
-
-        if pet_row:
-            pet_data = {
-                "pet_id": pet_row.pet_id,
-                "pet_name": pet_row.pet_name,
-                "happiness": pet_row.happiness,
-                "diet": pet_row.diet,
-                "exercise": pet_row.exercise,
-                "sleep": pet_row.sleep,
-                "wake_up_time": str(pet_row.wake_up_time),  # Convert time to string
-                "sleep_time": str(pet_row.sleep_time),
-                "exercise_dur": pet_row.exercise_dur,
-                "unhealthy_food_limit": pet_row.unhealthy_food_limit,
-                "meal_per_day": pet_row.meal_per_day
-            }
-
-            # Cache the pet data for 1 hour (3600 seconds)
-            redis_client.set(f"pet_stats:{pet_id}", json.dumps(pet_data), ex=3600)
-            
-            return pet_data
-        else:
-            raise HTTPException(status_code=404, detail="Pet not found")
-    
+        # The cached entry carries its version, so the ETag costs no extra lookup
+        cached = await repo.get_pet_entry(pet_id)
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error fetching pet: {e}")
 
-@app.post("/user/pet/{user_id}")
+    if cached is None:
+        raise HTTPException(status_code=404, detail="Pet not found")
+    version, pet_json = cached
+    etag = entity_tag(version, at)
+    return not_modified(request, etag) or JSONBytesResponse(current_pet_json(version, pet_json, at), headers=tag_headers(etag))
+
+@router.post("/user/pet/{user_id}")
 async def post_user_pet(user_id: int, pet_update: PetStats):
     try:
-        # Correct SQL query with proper field assignments
-        update_query = """
-            UPDATE pet.petspace 
-            SET pet_name = %s, happiness = %s, diet = %s, exercise = %s, sleep=%s,
-                wake_up_time = %s, sleep_time = %s, exercise_dur = %s, 
-                unhealthy_food_limit = %s, meal_per_day= %s
-            WHERE pet_id = %s
-        """
-        session.execute(update_query, (
-            pet_update.pet_name, 
-            pet_update.happiness,  # Fixed order
-            pet_update.diet, 
-            pet_update.exercise, 
-            pet_update.sleep,
-            pet_update.wake_up_time,
-            pet_update.sleep_time,
-            pet_update.exercise_dur,
-            pet_update.unhealthy_food_limit,
-            pet_update.meal_per_day,
-            user_id
-        ))
-
-        # After updating the database, update the cache in Redis
-        pet_data = {
-            "pet_id": user_id,
-            "pet_name": pet_update.pet_name,
-            "happiness": pet_update.happiness,
-            "diet": pet_update.diet,
-            "exercise": pet_update.exercise,
-            "sleep": pet_update.sleep,
-            "wake_up_time": str(pet_update.wake_up_time),  # Convert to string
-            "sleep_time": str(pet_update.sleep_time),
-            "exercise_dur": pet_update.exercise_dur,
-            "unhealthy_food_limit": pet_update.unhealthy_food_limit,
-            "meal_per_day": pet_update.meal_per_day
-        }
-
-        # Store the updated pet data in Redis for 24 hours (86400 seconds)
-        redis_client.set(f"pet_stats:{user_id}", json.dumps(pet_data), ex=86400)
+        pet_data = pet_to_dict(user_id, pet_update)
+        await repo.put_pet(pet_data)
+        await update_leaderboards(pet_data)
+        await notify(user_id, pet=pet_data)
 
         return {"message": "Pet data updated successfully", "pet_data": pet_data}
     
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error updating pet data: {e}")
 
-@app.get('/user/activity/{activity_id}')
-async def get_activity(activity_id: int):
-    # Check Redis cache first
-    cached_activity = redis_client.get(f"activity:{activity_id}")
-
-    if cached_activity:
-        return json.loads(cached_activity)  # Deserialize JSON data
 
+@router.patch("/user/pet/{pet_id}")
+async def patch_user_pet(pet_id: int, pet_patch: PetPatch):
+    # UPDATE of the sent columns plus an in-place patch of the cached copy. The cached
+    # pet is read first: the UPDATE is an upsert and would create a pet for an unknown id.
+    fields = patch_fields(pet_patch)
     try:
-        # Query activity data from the database
-        activity_query = """
-            SELECT activity_id, date, wake_up_time, sleep_time, exercise_duration, meals
-            FROM pet.activityspace WHERE activity_id = %s
-        """
-        activity_row = session.execute(activity_query, (activity_id,)).one()
-
-        if activity_row:
-            activity_data = {
-                "activity_id": activity_row.activity_id,
-                "date": activity_row.date,  # Convert to string
-                "wake_up_time": activity_row.wake_up_time if activity_row.wake_up_time else None,
-                "sleep_time": activity_row.sleep_time if activity_row.sleep_time else None,
-                "exercise_duration": activity_row.exercise_duration,
-                "meals": json.loads(activity_row.meals) if activity_row.meals else []
-            }
-
-            # Cache activity data for 1 hour (3600 seconds)
-            redis_client.set(f"activity:{activity_id}", json.dumps(activity_data), ex=3600)
-            
-            return activity_data
-        else:
-            raise HTTPException(status_code=404, detail="Activity not found")
+        pet_data = await repo.get_pet(pet_id)
+        if pet_data is None:
+            raise HTTPException(status_code=404, detail="Pet not found")
+        if any(stat in fields for stat in decay.STATS):
+            # The stats share one timestamp, so moving it re-bases the ones not sent at
+            # their current (decayed) values
+            now = decay.now()
+            current = decay.current(pet_data, now)
+            fields = dict(
+                {stat: current[stat] for stat in decay.STATS if current.get(stat) is not None},
+                **fields,
+                stats_updated_at=decay.stamp(now)
+            )
+        await repo.patch_pet(pet_id, fields)
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error updating pet data: {e}")
+    if "pet_name" in fields or any(stat in fields for stat in decay.STATS):
+        # Stat changes move the pet on the leaderboards, which also show its name
+        await update_leaderboards(dict(pet_data, **fields))
+    await notify(pet_id, pet=dict(pet_data, **fields))
+    return {"message": "Pet data updated successfully", "updated": fields}
+
+@router.get('/user/activity/{activity_id}')
+async def get_activity(activity_id: int, request: Request):
+    try:
+        # Cached JSON bytes and their version go straight out
+        cached = await repo.get_activity_entry(activity_id)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error fetching activity: {e}")
 
+    if cached is None:
+        raise HTTPException(status_code=404, detail="Activity not found")
+    version, activity_json = cached
+    etag = entity_tag(version)
+    return not_modified(request, etag) or JSONBytesResponse(activity_json, headers=tag_headers(etag))
+
+
+async def require_activity(activity_id: int):
+    # Decoded activity for handlers that modify it; 404 when there is none
+    try:
+        activity_data = await repo.get_activity(activity_id)
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error fetching activity: {e}")
 
-@app.post("/user/activity/{user_id}")
+    if activity_data is None:
+        raise HTTPException(status_code=404, detail="Activity not found")
+    return activity_data
+
+
+def activity_day(activity_data: dict):
+    # The day an activity row counts toward in history and rollups. Rows upserted
+    # without a date count toward today rather than failing every later write.
+    return date.fromisoformat(str(activity_data["date"])) if activity_data.get("date") else date.today()
+
+@router.post("/user/activity/{user_id}")
 async def post_activity(user_id: int ,activity_update: DailyActivity):
     try:
-        # Correct SQL query with proper field assignments
-        update_query = """
-            UPDATE pet.activityspace 
-            SET date = %s, wake_up_time = %s, sleep_time = %s, 
-                exercise_duration = %s, meals = %s
-            WHERE activity_id = %s
-        """
-
-        meals_to_store = [meal.dict() for meal in activity_update.meals] if activity_update.meals else None
-        meals_param = json.dumps(meals_to_store) if meals_to_store is not None else ""
-        
-        session.execute(update_query, (
-            activity_update.date,
-            activity_update.wake_up_time,
-            activity_update.sleep_time,
-            activity_update.exercise_duration,
-            meals_param,  # Store as JSON string
-            user_id
-        ))
+        activity_data = activity_to_dict(activity_update)
 
-        # After updating the database, update the cache in Redis
-        activity_data = {
-            "activity_id": activity_update.activity_id,
-            "date": activity_update.date.isoformat() if activity_update.date else None,
-            "wake_up_time": activity_update.wake_up_time.isoformat() if activity_update.wake_up_time else None,
-            "sleep_time": activity_update.sleep_time.isoformat() if activity_update.sleep_time else None,
-            "exercise_duration": activity_update.exercise_duration,
-            "meals": [meal.dict() for meal in activity_update.meals] if activity_update.meals else []
-        }
+        # Previous state of the row, so rollups get only the difference
+        previous = await repo.get_activity(user_id)
 
-        # Store updated activity data in Redis for 24 hours (86400 seconds)
-        redis_client.set(f"activity:{activity_update.activity_id}", json.dumps(activity_data), ex=86400)
+        # Current row and that day's history entry
+        await repo.save_activity(user_id, activity_data, history=[(activity_data, None)])
+
+        same_day = previous is not None and str(previous["date"]) == activity_data["date"]
+        await update_rollups(user_id, activity_update.date, rollups.delta(
+            rollups.contribution(previous) if same_day else {},
+            rollups.contribution(activity_data)
+        ))
+        await notify(user_id, activity=activity_data)
 
         return {"message": "Activity data updated successfully", "activity_data": activity_data}
     
@@ -414,92 +409,460 @@ async def post_activity(user_id: int ,activity_update: DailyActivity):
         raise HTTPException(status_code=500, detail=f"Error updating activity data: {e}")
     
 
-@app.post("/user/{user_id}/activity/wake")
-async def set_wake(user_id: int):
-    # Fetch activity data for the user and pet data
-    activity_data = await get_activity(user_id)
-    pet_data = await get_user_pet(user_id)
-
-    # Assuming activity_data['sleep_time'] is a string in "HH:MM:SS" format
-    sleep_time_str = activity_data['sleep_time']
-    today_date = datetime.today().date()
-
-    # Adjust to handle the fractional seconds
-    sleep_time = datetime.combine(today_date, datetime.strptime(sleep_time_str, "%H:%M:%S.%f").time())
-    # Calculate wake_time as the current time (let's assume it's 08:30:00 AM)
-    wake_time = datetime.now()
-    # Handle the case where sleep_time could be from the previous day
-    if sleep_time > wake_time:
-        sleep_time -= timedelta(days=1)
+async def notify(user_id: int, pet: Optional[dict] = None, activity: Optional[dict] = None):
+    # Pushes the new documents to the user's open event streams (push/router.py), on
+    # whichever worker holds them; every write of a pet or activity calls it. Handlers
+    # that patch a document send the copy they read with their fields applied, as the
+    # cache patch does. Best effort: clients still poll after reconnecting.
+    updates = {}
+    if pet is not None:
+        updates["pet"] = dumps(decay.current(pet))
+    if activity is not None:
+        updates["activity"] = dumps(activity)
+    try:
+        await push_hub.publish(user_id, updates)
+    except Exception as e:
+        logging.error(f"Error publishing updates for user {user_id}: {e}")
 
-    # Calculate sleep duration in hours
-    sleep_duration = (wake_time - sleep_time).total_seconds() / 3600  # Convert to hours
 
-    # Calculate diet completion
-    sum_data = 0
-    for meal in activity_data['meals']:  # Assuming 'meals' is a list of dicts or objects
-        sum_data += meal['healthy_score']
+async def update_leaderboards(pet: dict):
+    # Derived like the rollups: a failed ranking update never fails the write itself
+    try:
+        await repo.rank_pet(pet)
+    except Exception as e:
+        logging.error(f"Error updating leaderboards for pet {pet['pet_id']}: {e}")
 
-    # Calculate diet completion
-    diet_comp = min(len(activity_data['meals']) / pet_data['meal_per_day'], 1) * min(sum_data / len(activity_data['meals']) / 7, 1)
 
-    # Calculate exercise completion (ensure duration is in hours)
-    exercise_comp = min(activity_data['exercise_duration'] / pet_data['exercise_dur'], 1)
+async def update_rollups(user_id: int, day: date, change: dict):
+    # Rollups are derived data; a failure here must not fail the write that triggered it
+    try:
+        await repo.apply_rollups(user_id, day, change)
+    except Exception as e:
+        logging.error(f"Error updating rollups for user {user_id}: {e}")
 
-    # Calculate sleep completion (ensure time is in hours)
-    sleep_comp = min(sleep_duration / 8, 1) # hard code as 8 rn cant be fucked 
 
-    # Calculate happiness
-    happiness = 50 * sleep_comp + 30 * diet_comp + 20 * exercise_comp
+@router.post("/user/{user_id}/activity/wake")
+async def set_wake(user_id: int, response: Response):
+    timer = StageTimer()
+    # Fetch pet and activity together
+    try:
+        pet_data, activity_data = await repo.get_pet_and_activity(user_id)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error fetching wake data: {e}")
 
+    if pet_data is None:
+        raise HTTPException(status_code=404, detail="Pet not found")
+    if activity_data is None:
+        raise HTTPException(status_code=404, detail="Activity not found")
+    timer.mark("fetch")
 
-    pet_update = PetStats(**pet_data)
-    # Update pet data with calculated happiness
-    pet_update.happiness = int(happiness)
-    pet_update.exercise = int(100 * exercise_comp)
-    pet_update.diet = int(100 * diet_comp)
-    pet_update.sleep = int(100 * sleep_comp)
+    # Same vectorized formula the bulk recompute job uses, here for a single user
+    wake_time = datetime.now()
+    stats, sleep_duration = score_one(activity_data, pet_data, wake_time)
 
-    # Post the updated pet data
-    resp = await post_user_pet(user_id, pet_update)
+    # The cached dicts already have the stored/response shape: update them in place of
+    # rebuilding PetStats / DailyActivity models and converting back
+    pet = dict(pet_data, **stats, stats_updated_at=decay.stamp(wake_time.astimezone()))
+    new_activity = empty_activity(user_id, date.today())
+    timer.mark("compute")
 
-    # Create and store daily activity
-    daily_activity = DailyActivity(
-        activity_id=user_id,
-        date=date.today(),
-        wake_up_time=None,
-        sleep_time=None,  # You may want to set this to actual sleep time
-        exercise_duration=0,  # Update this based on actual data
-        meals=[]  # You can fill this if there are meals to log
-    )
+    try:
+        # Close out the finished day in the history table
+        day = activity_day(activity_data)
+        finished_day = dict(activity_data, date=day.isoformat(), wake_up_time=wake_time.time().isoformat())
+
+        # All rows written together, all or nothing
+        await repo.save_activity(
+            user_id,
+            new_activity,
+            pet=pet,
+            history=[(finished_day, sleep_duration)],
+            atomic=True
+        )
+        timer.mark("store")
+
+        # Derived data and the push don't depend on each other (and never fail the
+        # wake), so their round trips overlap instead of adding up
+        await asyncio.gather(
+            update_rollups(user_id, day, {"sleep_hours": sleep_duration, "nights": 1}),
+            update_leaderboards(pet),
+            notify(user_id, pet=pet, activity=new_activity),
+        )
+        timer.mark("derived")
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error storing wake data: {e}")
 
-    resp = await post_activity(user_id, daily_activity)
+    response.headers["Server-Timing"] = timer.server_timing()
+    logging.debug(f"Wake for user {user_id} took {timer.total:.2f}ms: {timer.stages}")
 
     # Return response
     return {"message": "Daily activity stored successfully!", "key": sleep_duration}
 
-@app.post("/user/{user_id}/activity/sleep")
+@router.post("/user/{user_id}/activity/sleep")
 async def set_sleep(user_id: int):
-    activity_data = await get_activity(user_id)
-
+    # The cached activity only confirms the row exists; the write is one column
+    activity_data = await require_activity(user_id)
     currenttime = datetime.now()
-    activity_update = DailyActivity(**activity_data)
+    fields = {"sleep_time": currenttime.time().isoformat()}
+    try:
+        # The day's history entry gets sleep_time when set_wake closes the day
+        await repo.patch_activity(user_id, fields)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error logging sleep: {e}")
 
-    activity_update.sleep_time = currenttime
-    resp = await post_activity(user_id, activity_update)
+    await notify(user_id, activity=dict(activity_data, **fields))
 
     return {"message": "Succeed to log sleep", "key": currenttime}
     
 
-@app.post("/user/{user_id}/activity/exercise")
+@router.post("/user/{user_id}/activity/exercise")
 async def log_exercise(user_id: int,exercise_dur: float):
-    activity_data = await get_activity(user_id)
-    
-    activity_update = DailyActivity(**activity_data)
-
-    activity_update.exercise_duration = exercise_dur
-    resp = await post_activity(user_id, activity_update)
+    # The (cached) activity gives the rollup delta and the history day; only
+    # exercise_duration is written
+    activity_data = await require_activity(user_id)
+    day = activity_day(activity_data)
+    try:
+        await repo.patch_activity(user_id, {"exercise_duration": exercise_dur}, day=day)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error logging exercise: {e}")
 
+    await update_rollups(user_id, day, {
+        "exercise": exercise_dur - (activity_data["exercise_duration"] or 0.0)
+    })
+    await notify(user_id, activity=dict(activity_data, exercise_duration=exercise_dur))
     return {"message": "Succeed to log exercise"}
 
 
+@router.patch("/user/activity/{activity_id}")
+async def patch_activity(activity_id: int, activity_patch: ActivityPatch):
+    fields = patch_fields(activity_patch, nullable=("wake_up_time", "sleep_time"))
+    # Like patch_user_pet: no upserted activity for an unknown id
+    activity_data = await require_activity(activity_id)
+    try:
+        await repo.patch_activity(activity_id, fields)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error updating activity data: {e}")
+    await notify(activity_id, activity=dict(activity_data, **fields))
+    return {"message": "Activity data updated successfully", "updated": fields}
+
+
+@router.post("/user/{user_id}/activity/meal")
+async def log_meal(user_id: int, meal: MealActivity):
+    # The (cached) activity only says the row exists (the append would otherwise create
+    # one for an unknown user) and which day the meal counts toward
+    activity_data = await require_activity(user_id)
+    day = activity_day(activity_data)
+    try:
+        # Blind append to the meal lists of the activity and the day's history entry:
+        # no full rewrite of either row
+        await repo.append_meal(user_id, meal.dict(), day=day)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error logging meal: {e}")
+
+    await update_rollups(user_id, day, {"meals": 1, "healthy_score": meal.healthy_score})
+    await notify(user_id, activity=dict(activity_data, meals=(activity_data["meals"] or []) + [meal.dict()]))
+    return {"message": "Succeed to log meal"}
+
+
+class ActivityEvent(BaseModel):
+    event_id: str  # Client generated, used to drop replays
+    user_id: int
+    type: Literal["sleep", "wake", "exercise", "meal"]
+    timestamp: datetime
+    exercise_dur: Optional[float] = None
+    meal: Optional[MealActivity] = None
+
+
+class ActivityEventBatch(BaseModel):
+    events: List[ActivityEvent]
+
+
+# Event ids are remembered for a week, longer than any offline backlog
+SYNC_EVENT_TTL = 7 * 86400
+MAX_SYNC_EVENTS = 1000
+
+
+def sync_event_key(event: ActivityEvent):
+    return f"sync_event:{event.user_id}:{event.event_id}"
+
+
+def empty_activity(user_id: int, day: date):
+    return activity_to_dict(DailyActivity(
+        activity_id=user_id,
+        date=day,
+        wake_up_time=None,
+        sleep_time=None,
+        exercise_duration=0,
+        meals=[]
+    ))
+
+
+def server_time(moment: datetime):
+    # Event timestamps as the naive server-local times set_sleep/set_wake use; clients
+    # may send them with an offset (toISOString() gives UTC with a "Z")
+    if moment.tzinfo is None:
+        return moment
+    return moment.astimezone().replace(tzinfo=None)
+
+
+async def apply_user_events(user_id: int, events: List[ActivityEvent]):
+    # Folds one user's events into their rows in memory, then writes each row once
+    pet_data, activity_data = await repo.get_pet_and_activity(user_id)
+    if pet_data is None or activity_data is None:
+        raise HTTPException(status_code=404, detail="User not found")
+
+    pet, activity = dict(pet_data), dict(activity_data, date=activity_day(activity_data).isoformat())
+    results = {}
+    closed_days = []  # (activity dict, sleep hours)
+    rollup_changes = []  # (day, change)
+    counted = rollups.contribution(activity)  # already in the rollups
+    touched = False  # current day changed since the last wake
+
+    for event in events:
+        timestamp = server_time(event.timestamp)
+        if event.type == "sleep":
+            activity["sleep_time"] = timestamp.time().isoformat()
+        elif event.type == "exercise":
+            if event.exercise_dur is None:
+                results[event.event_id] = {"status": "invalid", "detail": "exercise_dur is required"}
+                continue
+            activity["exercise_duration"] = event.exercise_dur
+        elif event.type == "meal":
+            if event.meal is None:
+                results[event.event_id] = {"status": "invalid", "detail": "meal is required"}
+                continue
+            activity["meals"] = (activity["meals"] or []) + [event.meal.dict()]
+        else:
+            stats, sleep_hours = score_one(activity, pet, timestamp)
+            # The new stats decay from the wake event, not from when the backlog arrived
+            pet.update(stats, stats_updated_at=decay.stamp(timestamp.astimezone()))
+            day = date.fromisoformat(str(activity["date"]))
+            rollup_changes.append((day, rollups.delta(counted, rollups.contribution(activity))))
+            rollup_changes.append((day, {"sleep_hours": sleep_hours, "nights": 1}))
+            closed_days.append((dict(activity, wake_up_time=timestamp.time().isoformat()), sleep_hours))
+            activity = empty_activity(user_id, timestamp.date())
+            counted = {}
+            touched = False
+            results[event.event_id] = {"status": "applied"}
+            continue
+        touched = True
+        results[event.event_id] = {"status": "applied"}
+
+    day = date.fromisoformat(str(activity["date"]))
+    rollup_changes.append((day, rollups.delta(counted, rollups.contribution(activity))))
+
+    # One write per row touched
+    history = ([(activity, None)] if touched else []) + closed_days
+    await repo.save_activity(user_id, activity, pet=pet if closed_days else None, history=history)
+
+    # Counter increments commute, so like set_wake these all run at once
+    updates = [update_rollups(user_id, day, change) for day, change in rollup_changes]
+    if closed_days:
+        updates.append(update_leaderboards(pet))
+    await asyncio.gather(*updates, notify(user_id, pet=pet if closed_days else None, activity=activity))
+    return results
+
+
+@router.post("/sync/events")
+async def sync_events(batch: ActivityEventBatch):
+    # Replays an offline backlog: events are applied in order per user, users concurrently
+    if len(batch.events) > MAX_SYNC_EVENTS:
+        raise HTTPException(status_code=413, detail=f"At most {MAX_SYNC_EVENTS} events per request")
+
+    # Claim every event id in one round trip; ids already claimed were applied before
+    try:
+        claimed = await repo.claim_events([sync_event_key(event) for event in batch.events], SYNC_EVENT_TTL)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error claiming events: {e}")
+
+    results = [None] * len(batch.events)
+    positions = {}  # (user_id, event_id) -> index of the claimed event
+    by_user = defaultdict(list)
+    for i, (event, fresh) in enumerate(zip(batch.events, claimed)):
+        if not fresh:
+            results[i] = {"status": "duplicate"}
+        else:
+            positions[(event.user_id, event.event_id)] = i
+            by_user[event.user_id].append(event)
+
+    outcomes = await asyncio.gather(*(
+        apply_user_events(user_id, events) for user_id, events in by_user.items()
+    ), return_exceptions=True)
+
+    unapplied = []
+    for (user_id, events), outcome in zip(by_user.items(), outcomes):
+        if isinstance(outcome, Exception):
+            detail = outcome.detail if isinstance(outcome, HTTPException) else str(outcome)
+            outcome = {event.event_id: {"status": "error", "detail": detail} for event in events}
+        unapplied += [sync_event_key(event) for event in events if outcome[event.event_id]["status"] != "applied"]
+        for event_id, result in outcome.items():
+            results[positions[(user_id, event_id)]] = result
+    # Failed and invalid events were not applied: releasing their ids lets the client
+    # retry them (or resend them corrected) instead of getting "duplicate"
+    await repo.release_events(unapplied)
+
+    return {"results": [
+        {"event_id": event.event_id, "user_id": event.user_id, **result}
+        for event, result in zip(batch.events, results)
+    ]}
+
+
+HISTORY_MAX_DAYS = 366
+
+
+@router.get("/user/{user_id}/activity/history")
+async def get_activity_history(user_id: int, start: Optional[date] = None, end: Optional[date] = None, limit: int = 31):
+    # Newest first. For the following page pass the returned `next` as `end` and the
+    # returned `start` as `start`: without it the default range moves with `end`.
+    end = end or date.today()
+    start = start or end - timedelta(days=6)
+    limit = max(1, min(limit, HISTORY_MAX_DAYS))
+    if start > end:
+        raise HTTPException(status_code=400, detail="start must be on or before end")
+
+    try:
+        # One extra row tells whether there is a next page
+        items = await repo.history(user_id, start, end, limit + 1)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error fetching activity history: {e}")
+
+    next_end = None
+    if len(items) > limit:
+        items = items[:limit]
+        next_end = (date.fromisoformat(items[-1]["date"]) - timedelta(days=1)).isoformat()
+    return {"items": items, "start": start.isoformat(), "next": next_end}
+
+
+@router.get("/user/{user_id}/stats/rollups")
+async def get_rollups(user_id: int, period: str = "week", count: int = 4):
+    # Totals for the last `count` days/weeks/months, newest first
+    if period not in rollups.PERIODS:
+        raise HTTPException(status_code=400, detail=f"period must be one of {', '.join(rollups.PERIODS)}")
+    count = max(1, min(count, 366))
+    try:
+        return {"period": period, "items": await repo.read_rollups(user_id, period, count)}
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error fetching rollups: {e}")
+
+
+@router.get("/leaderboard")
+async def get_leaderboard(k: int = 10, group_id: Optional[str] = None):
+    # Top k pets by current happiness, globally or within one friend group
+    k = max(1, min(k, leaderboard.MAX_TOP))
+    try:
+        return {"group_id": group_id, "items": await repo.leaderboard_top(group_id, k)}
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error fetching leaderboard: {e}")
+
+
+@router.get("/leaderboard/{user_id}")
+async def get_leaderboard_rank(user_id: int, radius: int = 5, group_id: Optional[str] = None):
+    # The user's rank and the `radius` pets ranked either side of it
+    radius = max(0, min(radius, leaderboard.MAX_RADIUS))
+    try:
+        around = await repo.leaderboard_around(group_id, user_id, radius)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error fetching leaderboard: {e}")
+
+    if around is None:
+        raise HTTPException(status_code=404, detail="User is not on this leaderboard")
+    return {"group_id": group_id, "user_id": user_id, **around}
+
+
+@router.put("/leaderboard/groups/{group_id}/members/{user_id}")
+async def join_friend_group(group_id: str, user_id: int):
+    try:
+        await repo.join_group(group_id, user_id)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error joining group: {e}")
+    return {"message": f"User {user_id} joined group {group_id}"}
+
+
+@router.delete("/leaderboard/groups/{group_id}/members/{user_id}")
+async def leave_friend_group(group_id: str, user_id: int):
+    try:
+        await repo.leave_group(group_id, user_id)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error leaving group: {e}")
+    return {"message": f"User {user_id} left group {group_id}"}
+
+
+@router.get("/metrics")
+async def get_metrics():
+    if not metrics.METRICS_ENABLED:
+        raise HTTPException(status_code=404, detail="Metrics are disabled")
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
+
+
+@router.get("/cache/stats")
+async def get_cache_stats():
+    return repo.cache_stats()
+
+
+# Seconds the readiness probe waits for the stores before reporting not ready
+READINESS_TIMEOUT = 2.0
+
+
+@router.get("/healthz")
+async def liveness():
+    # The process is up and its event loop is answering
+    return {"status": "ok"}
+
+
+@router.get("/readyz")
+async def readiness(request: Request):
+    # Ready once startup finished and the stores answer; false again while shutting down
+    if not request.app.state.ready:
+        raise HTTPException(status_code=503, detail="Starting up or shutting down")
+    try:
+        await asyncio.wait_for(repo.ping(), READINESS_TIMEOUT)
+    except Exception as e:
+        raise HTTPException(status_code=503, detail=f"Storage unavailable: {e!r}")
+    return {"status": "ready"}
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Storage connections, schema, prepared statements and the inference workers all come
+    # up concurrently, and only here: importing main (or forking a worker) connects nothing
+    await asyncio.gather(repo.start(), warm_pool())
+    await push_hub.start()
+    loop_lag_watcher = asyncio.create_task(metrics.watch_loop_lag()) if metrics.METRICS_ENABLED else None
+    app.state.ready = True
+    try:
+        yield
+    finally:
+        # Fail readiness first so the load balancer drains this worker, then release everything
+        app.state.ready = False
+        # Ends any event streams still open
+        await push_hub.close()
+        if loop_lag_watcher is not None:
+            loop_lag_watcher.cancel()
+        await food_batcher.close()
+        shutdown_pool()
+        await repo.close()
+
+
+def create_app():
+    app = FastAPI(lifespan=lifespan)
+    app.state.ready = False
+    app.include_router(router)
+    # Meal photo classification (/analyse-food)
+    app.include_router(food_router)
+    # Live pet/activity updates over Server-Sent Events (/user/{user_id}/events)
+    app.include_router(push_router)
+
+    # Configure CORS
+    app.add_middleware(
+        CORSMiddleware,
+        allow_origins=["*"],  # In production, replace with specific origins 
+        allow_credentials=True,
+        allow_methods=["*"],
+        allow_headers=["*"],
+    )
+    if metrics.METRICS_ENABLED:
+        app.add_middleware(metrics.MetricsMiddleware)
+    return app
+
+
+app = create_app()
@@ -0,0 +1,226 @@
+import asyncio
+import functools
+import logging
+import os
+from bisect import bisect_left
+from time import perf_counter
+
+try:
+    from opentelemetry import trace
+except ImportError:  # spans are skipped without opentelemetry-api
+    trace = None
+
+# Latency histograms, cache counters and event-loop lag, served on /metrics in the
+# Prometheus text format. With METRICS_ENABLED=0 nothing is wrapped or measured.
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "1") == "1"
+# Also emit OpenTelemetry spans for requests and Cassandra statements
+# (needs opentelemetry-api plus whatever SDK/exporter the deployment configures)
+TRACING_ENABLED = os.getenv("TRACING_ENABLED", "0") == "1" and trace is not None
+# How often the event loop is probed for lag, in seconds
+LOOP_LAG_INTERVAL = float(os.getenv("LOOP_LAG_INTERVAL", "0.5"))
+
+# Upper bounds in seconds, from sub-millisecond cache hits to slow Astra round trips
+BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+tracer = trace.get_tracer("tamaai") if TRACING_ENABLED else None
+
+
+def _labels(names, values):
+    if not names:
+        return ""
+    pairs = ",".join(f'{name}="{str(value).replace(chr(34), chr(39))}"' for name, value in zip(names, values))
+    return "{" + pairs + "}"
+
+
+class Histogram:
+    def __init__(self, name, help, labels=(), buckets=BUCKETS):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self.buckets = buckets
+        self._series = {}  # label values -> [bucket counts..., sum, count]
+
+    def observe(self, value, *label_values):
+        series = self._series.get(label_values)
+        if series is None:
+            series = self._series[label_values] = [0] * (len(self.buckets) + 2)
+        index = bisect_left(self.buckets, value)
+        if index < len(self.buckets):  # above the last bound only counts towards +Inf
+            series[index] += 1
+        series[-2] += value
+        series[-1] += 1
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        for label_values, series in self._series.items():
+            cumulative = 0
+            for bound, count in zip(self.buckets, series):
+                cumulative += count
+                labels = _labels(self.labels + ("le",), label_values + (bound,))
+                lines.append(f"{self.name}_bucket{labels} {cumulative}")
+            labels = _labels(self.labels + ("le",), label_values + ("+Inf",))
+            lines.append(f"{self.name}_bucket{labels} {series[-1]}")
+            lines.append(f"{self.name}_sum{_labels(self.labels, label_values)} {series[-2]}")
+            lines.append(f"{self.name}_count{_labels(self.labels, label_values)} {series[-1]}")
+        return lines
+
+
+class Gauge:
+    def __init__(self, name, help, labels=(), kind="gauge"):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self.kind = kind
+        self._values = {}
+
+    def set(self, value, *label_values):
+        self._values[label_values] = value
+
+    def inc(self, *label_values):
+        self._values[label_values] = self._values.get(label_values, 0) + 1
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        lines += [f"{self.name}{_labels(self.labels, values)} {value}" for values, value in self._values.items()]
+        return lines
+
+
+http_latency = Histogram("http_request_duration_seconds", "HTTP request latency by route", ("method", "route", "status"))
+cql_latency = Histogram("cassandra_statement_duration_seconds", "Cassandra statement latency", ("statement",))
+cql_errors = Gauge("cassandra_statement_errors_total", "Failed Cassandra statements", ("statement",), kind="counter")
+redis_latency = Histogram("redis_command_duration_seconds", "Redis command (or pipeline) latency", ("command",))
+loop_lag = Histogram("event_loop_lag_seconds", "Delay between a scheduled wakeup and when the event loop ran it")
+cache_hits = Gauge("cache_hits_total", "Cache hits by cache and tier", ("cache", "tier"), kind="counter")
+cache_misses = Gauge("cache_misses_total", "Cache misses by cache", ("cache",), kind="counter")
+cache_hit_ratio = Gauge("cache_hit_ratio", "Hits / lookups since start", ("cache",))
+cache_size = Gauge("cache_entries", "Entries held in process", ("cache",))
+
+REGISTRY = [http_latency, cql_latency, cql_errors, redis_latency, loop_lag, cache_hits, cache_misses, cache_hit_ratio, cache_size]
+
+# Callables run on every scrape to refresh pull-style gauges (cache stats)
+_collectors = []
+
+
+def register_collector(collect):
+    _collectors.append(collect)
+
+
+def render():
+    for collect in _collectors:
+        try:
+            collect()
+        except Exception as e:
+            logging.error(f"Metrics collector failed: {e}")
+    lines = []
+    for metric in REGISTRY:
+        lines += metric.render()
+    return "\n".join(lines) + "\n"
+
+
+def record_cache(name, stats, tier="local"):
+    # Mirrors a stats() dict (LocalCache, ClassificationCache) into the cache gauges
+    if "local_hits" in stats:
+        for source in ("local", "redis"):
+            cache_hits.set(stats[f"{source}_hits"], name, source)
+    else:
+        cache_hits.set(stats["hits"], name, tier)
+    cache_misses.set(stats["misses"], name)
+    cache_hit_ratio.set(stats["hit_ratio"], name)
+    if "size" in stats:
+        cache_size.set(stats["size"], name)
+
+
+class MetricsMiddleware:
+    """Pure ASGI middleware timing every HTTP request by its route template."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        status = 500
+
+        async def send_with_status(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        started = perf_counter()
+        span = tracer.start_as_current_span(f"{scope['method']} {scope['path']}") if tracer else None
+        try:
+            if span is None:
+                await self.app(scope, receive, send_with_status)
+            else:
+                with span:
+                    await self.app(scope, receive, send_with_status)
+        finally:
+            # The router stores the matched route in the scope; unmatched paths share one label
+            route = scope.get("route")
+            http_latency.observe(perf_counter() - started, scope["method"], getattr(route, "path", "unmatched"), status)
+
+
+def instrument_session(db, statements):
+    # Wraps AsyncSession.execute (execute_many/execute_batch go through it) with per-statement timing
+    execute = db.execute
+
+    @functools.wraps(execute)
+    async def timed_execute(query, parameters=None, **kwargs):
+        name = statements.name_of(query) or type(query).__name__
+        started = perf_counter()
+        try:
+            if tracer is None:
+                return await execute(query, parameters, **kwargs)
+            with tracer.start_as_current_span(f"cql {name}"):
+                return await execute(query, parameters, **kwargs)
+        except Exception:
+            cql_errors.inc(name)
+            raise
+        finally:
+            cql_latency.observe(perf_counter() - started, name)
+
+    db.execute = timed_execute
+
+
+def instrument_redis(client):
+    # Times single commands by name, and whole pipelines as one "PIPELINE" observation
+    execute_command = client.execute_command
+
+    @functools.wraps(execute_command)
+    async def timed_command(*args, **options):
+        started = perf_counter()
+        try:
+            return await execute_command(*args, **options)
+        finally:
+            redis_latency.observe(perf_counter() - started, str(args[0]).upper())
+
+    make_pipeline = client.pipeline
+
+    @functools.wraps(make_pipeline)
+    def timed_pipeline(*args, **kwargs):
+        pipe = make_pipeline(*args, **kwargs)
+        execute = pipe.execute
+
+        async def timed_execute(*execute_args, **execute_kwargs):
+            started = perf_counter()
+            try:
+                return await execute(*execute_args, **execute_kwargs)
+            finally:
+                redis_latency.observe(perf_counter() - started, "PIPELINE")
+
+        pipe.execute = timed_execute
+        return pipe
+
+    client.execute_command = timed_command
+    client.pipeline = timed_pipeline
+
+
+async def watch_loop_lag(interval=LOOP_LAG_INTERVAL):
+    # A blocking call anywhere on the loop shows up as this sleep overshooting
+    loop = asyncio.get_running_loop()
+    while True:
+        expected = loop.time() + interval
+        await asyncio.sleep(interval)
+        loop_lag.observe(max(0.0, loop.time() - expected))
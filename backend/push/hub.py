@@ -0,0 +1,146 @@
+import asyncio
+import logging
+import os
+
+# Live updates for connected clients. A write publishes the new document on the
+# user's Redis channel; each worker holds ONE pub/sub connection, subscribed only to
+# the channels of users with a stream open on that worker, and hands messages to
+# those streams.
+CHANNEL_PREFIX = "push:"
+
+# Open streams per worker; more are refused rather than exhausting memory
+PUSH_MAX_CONNECTIONS = int(os.getenv("PUSH_MAX_CONNECTIONS", "20000"))
+
+
+def channel(user_id):
+    return f"{CHANNEL_PREFIX}{user_id}"
+
+
+class Subscriber:
+    """One open stream. Keeps only the latest update of each kind (pet, activity), so a
+    slow or stalled client costs at most one document per kind however much is published.
+    """
+
+    __slots__ = ("user_id", "_latest", "_ready", "closed")
+
+    def __init__(self, user_id):
+        self.user_id = user_id
+        self._latest = {}  # kind -> encoded JSON
+        self._ready = asyncio.Event()
+        self.closed = False
+
+    def offer(self, kind, data):
+        self._latest[kind] = data
+        self._ready.set()
+
+    def close(self):
+        self.closed = True
+        self._ready.set()
+
+    async def next(self):
+        # {kind: data} of everything published since the last call; {} once closed
+        await self._ready.wait()
+        self._ready.clear()
+        updates, self._latest = self._latest, {}
+        return {} if self.closed else updates
+
+
+class PushHub:
+    def __init__(self, redis_client, max_connections=PUSH_MAX_CONNECTIONS):
+        self.redis = redis_client
+        self.max_connections = max_connections
+        self._subscribers = {}  # user_id -> set of Subscriber
+        self._pubsub = None
+        self._listener = None
+        self._first_channel = asyncio.Event()
+        self.connections = 0
+        self.delivered = 0
+
+    def full(self):
+        return self.connections >= self.max_connections
+
+    async def start(self):
+        # Created here so the event belongs to the loop the listener runs on
+        self._first_channel = asyncio.Event()
+        self._listener = asyncio.create_task(self._listen())
+
+    async def close(self):
+        # Ends every open stream, then drops the Redis subscription
+        for subscribers in self._subscribers.values():
+            for subscriber in subscribers:
+                subscriber.close()
+        self._subscribers.clear()
+        self.connections = 0
+        if self._listener is not None:
+            self._listener.cancel()
+
+    async def subscribe(self, user_id):
+        subscriber = Subscriber(user_id)
+        subscribers = self._subscribers.setdefault(user_id, set())
+        subscribers.add(subscriber)
+        self.connections += 1
+        if len(subscribers) == 1 and self._pubsub is not None:
+            # First stream for this user on this worker
+            try:
+                await self._pubsub.subscribe(channel(user_id))
+            except Exception as e:
+                # The listener resubscribes every open stream when it reconnects
+                logging.error(f"Push subscribe failed for user {user_id}: {e}")
+            self._first_channel.set()
+        return subscriber
+
+    async def unsubscribe(self, subscriber):
+        subscribers = self._subscribers.get(subscriber.user_id)
+        if subscribers is None or subscriber not in subscribers:
+            return
+        subscribers.discard(subscriber)
+        self.connections -= 1
+        if not subscribers:
+            del self._subscribers[subscriber.user_id]
+            if self._pubsub is not None:
+                await self._pubsub.unsubscribe(channel(subscriber.user_id))
+
+    async def publish(self, user_id, updates):
+        # {kind: encoded JSON document}; documents are forwarded to clients as-is
+        updates = {kind: data.decode() if isinstance(data, bytes) else data for kind, data in updates.items()}
+        async with self.redis.pipeline(transaction=False) as pipe:
+            for kind, data in updates.items():
+                pipe.publish(channel(user_id), f"{kind} {data}")
+            await pipe.execute()
+
+    def _deliver(self, user_id, kind, data):
+        for subscriber in self._subscribers.get(user_id, ()):
+            subscriber.offer(kind, data)
+            self.delivered += 1
+
+    async def _listen(self):
+        # Runs for the life of the worker, like the cache invalidation listener
+        while True:
+            try:
+                async with self.redis.pubsub(ignore_subscribe_messages=True) as pubsub:
+                    self._pubsub = pubsub
+                    # Streams opened before (or while disconnected) keep receiving
+                    if self._subscribers:
+                        await pubsub.subscribe(*(channel(user_id) for user_id in self._subscribers))
+                    while True:
+                        if pubsub.connection is None:
+                            # Nothing to read until the first SUBSCRIBE opens the connection
+                            self._first_channel.clear()
+                            await self._first_channel.wait()
+                            continue
+                        message = await pubsub.get_message(ignore_subscribe_messages=True, timeout=1.0)
+                        if message is None:
+                            continue
+                        user_id = int(message["channel"][len(CHANNEL_PREFIX):])
+                        kind, _, data = message["data"].partition(" ")
+                        self._deliver(user_id, kind, data)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logging.error(f"Push listener disconnected: {e}")
+                await asyncio.sleep(1)
+            finally:
+                self._pubsub = None
+
+    def stats(self):
+        return {"connections": self.connections, "users": len(self._subscribers), "delivered": self.delivered}
@@ -0,0 +1,59 @@
+import asyncio
+import os
+
+from fastapi import APIRouter, HTTPException
+from fastapi.responses import StreamingResponse
+
+from cache.client import redis_client
+from push.hub import PushHub
+
+router = APIRouter()
+
+# Seconds between comment lines on an idle stream, so proxies keep it open
+PUSH_KEEPALIVE = float(os.getenv("PUSH_KEEPALIVE", "25"))
+# Streams end after this many seconds and the client reconnects (EventSource does so by
+# itself). Bounds how long a draining worker waits on them and rebalances clients.
+PUSH_STREAM_SECONDS = float(os.getenv("PUSH_STREAM_SECONDS", "600"))
+# Delay the client waits before reconnecting, in milliseconds
+PUSH_RETRY_MS = 5000
+
+hub = PushHub(redis_client)
+
+
+async def stream(user_id):
+    # Subscribes once the response starts, so a client gone before then leaves nothing behind
+    subscriber = await hub.subscribe(user_id)
+    loop = asyncio.get_running_loop()
+    ends_at = loop.time() + PUSH_STREAM_SECONDS
+    try:
+        yield f"retry: {PUSH_RETRY_MS}\n\n"
+        while loop.time() < ends_at:
+            try:
+                updates = await asyncio.wait_for(subscriber.next(), min(PUSH_KEEPALIVE, ends_at - loop.time()))
+            except asyncio.TimeoutError:
+                yield ": keepalive\n\n"
+                continue
+            if subscriber.closed:
+                return
+            for kind, data in updates.items():
+                yield f"event: {kind}\ndata: {data}\n\n"
+    finally:
+        # Also runs when the client disconnects and the response is cancelled
+        await hub.unsubscribe(subscriber)
+
+
+@router.get("/user/{user_id}/events")
+async def user_events(user_id: int):
+    # Server-Sent Events: `pet` and `activity` events carry the full updated document,
+    # replacing polling of /user/pet/{id} and /user/activity/{id}
+    if hub.full():
+        raise HTTPException(status_code=503, detail="Too many open streams, try again shortly", headers={"Retry-After": "5"})
+    return StreamingResponse(stream(user_id), media_type="text/event-stream", headers={
+        "Cache-Control": "no-cache",
+        "X-Accel-Buffering": "no",  # nginx would otherwise hold events back
+    })
+
+
+@router.get("/events/stats")
+async def events_stats():
+    return hub.stats()
@@ -1,15 +1,18 @@
-import redis
-
-
-# Connect to Redis server
-redis_client = redis.StrictRedis(host="localhost", port=6379, db=0, decode_responses=True)
+from cache.client import pipeline, redis_client
 
 
+async def redis_post_wake_time(key, value):
+    await redis_client.set(key, value)
+    return {"message": f"Key '{key}' set to value '{value}' in cache."}
 
-def redis_post_wake_time(key, value):
-    redis_client.set(key, value)
+async def redis_post_sleep_time(key, value):
+    await redis_client.set(key, value)
     return {"message": f"Key '{key}' set to value '{value}' in cache."}
 
-def redis_post_sleep_time(key, value):
-    redis_client.set(key, value)
-    return {"message": f"Key '{key}' set to value '{value}' in cache."}
\ No newline at end of file
+async def redis_post_times(times):
+    # Several wake/sleep keys in one round trip
+    async with pipeline() as pipe:
+        for key, value in times.items():
+            pipe.set(key, value)
+        await pipe.execute()
+    return {"message": f"{len(times)} keys set in cache."}
@@ -0,0 +1,140 @@
+from datetime import date, timedelta
+
+# Daily/weekly/monthly totals for the stats dashboard, maintained incrementally:
+# every activity write adds its delta to a counter row (durable; see the repository's
+# _increment_rollups / _load_rollups) and to a Redis hash (fast reads), so reading a
+# period never touches raw activity rows.
+PERIODS = ("day", "week", "month")
+
+# metric -> (counter column, scale). Counters are integers, so fractional hours
+# are stored in thousandths.
+COUNTERS = {
+    "exercise": ("exercise_milli", 1000),
+    "meals": ("meals", 1),
+    "healthy_score": ("healthy_score", 1),
+    "sleep_hours": ("sleep_milli_hours", 1000),
+    "nights": ("nights", 1),
+}
+
+# Redis copies are rebuilt from Cassandra when they expire
+ROLLUP_CACHE_TTL = 3600
+
+# Increments the hash only if it is already cached; a partial hash would
+# otherwise be mistaken for the full period totals
+_HINCR_IF_EXISTS = """
+if redis.call('EXISTS', KEYS[1]) == 1 then
+    for i = 1, #ARGV, 2 do
+        redis.call('HINCRBYFLOAT', KEYS[1], ARGV[i], ARGV[i + 1])
+    end
+    return 1
+end
+return 0
+"""
+_scripts = {}
+
+
+def period_start(period, day):
+    if period == "day":
+        return day
+    if period == "week":
+        return day - timedelta(days=day.weekday())  # Monday
+    return day.replace(day=1)
+
+
+def previous_start(period, start):
+    if period == "day":
+        return start - timedelta(days=1)
+    if period == "week":
+        return start - timedelta(weeks=1)
+    return (start - timedelta(days=1)).replace(day=1)
+
+
+def rollup_key(user_id, period, start):
+    return f"rollup:{user_id}:{period}:{start.isoformat()}"
+
+
+def contribution(activity_data):
+    # What one day's activity dict adds to the totals (sleep is added at wake time)
+    meals = (activity_data or {}).get("meals") or []
+    return {
+        "exercise": (activity_data or {}).get("exercise_duration") or 0.0,
+        "meals": len(meals),
+        "healthy_score": sum(meal["healthy_score"] for meal in meals),
+    }
+
+
+def delta(old, new):
+    return {metric: new.get(metric, 0) - old.get(metric, 0) for metric in set(old) | set(new)}
+
+
+def counter_params(change):
+    return tuple(
+        round(change.get(metric, 0) * scale) for metric, (_, scale) in COUNTERS.items()
+    )
+
+
+def from_counters(row):
+    return {metric: (getattr(row, column) or 0) / scale for metric, (column, scale) in COUNTERS.items()}
+
+
+async def apply(redis_client, increment, user_id, day, change):
+    # Adds `change` ({metric: amount}) to the day, week and month containing `day`.
+    # `increment(user_id, starts, params)` adds counter_params to the stored rows of
+    # each {period: start}.
+    if not any(change.values()):
+        return
+    params = counter_params(change)
+    starts = {period: period_start(period, day) for period in PERIODS}
+
+    await increment(user_id, starts, params)
+
+    if "hincr_if_exists" not in _scripts:
+        _scripts["hincr_if_exists"] = redis_client.register_script(_HINCR_IF_EXISTS)
+    script = _scripts["hincr_if_exists"]
+    args = [value for metric, amount in change.items() if amount for value in (metric, amount)]
+    async with redis_client.pipeline(transaction=False) as pipe:
+        for period, start in starts.items():
+            await script(keys=[rollup_key(user_id, period, start)], args=args, client=pipe)
+        await pipe.execute()
+
+
+def summarize(start, totals):
+    return {
+        "period_start": start.isoformat(),
+        **totals,
+        "avg_sleep_hours": totals["sleep_hours"] / totals["nights"] if totals["nights"] else None,
+        "avg_healthy_score": totals["healthy_score"] / totals["meals"] if totals["meals"] else None,
+    }
+
+
+async def read(redis_client, load, user_id, period, count, until=None):
+    # The last `count` periods up to and including the one containing `until`, newest
+    # first. `load(user_id, period, first, last)` returns {start: totals} of the stored
+    # rows between two period starts.
+    starts = [period_start(period, until or date.today())]
+    while len(starts) < count:
+        starts.append(previous_start(period, starts[-1]))
+    keys = [rollup_key(user_id, period, start) for start in starts]
+
+    async with redis_client.pipeline(transaction=False) as pipe:
+        for key in keys:
+            pipe.hgetall(key)
+        cached = await pipe.execute()
+
+    totals = {}
+    for start, values in zip(starts, cached):
+        if values:
+            totals[start] = {metric: float(values.get(metric, 0)) for metric in COUNTERS}
+
+    missing = [start for start in starts if start not in totals]
+    if missing:
+        found = await load(user_id, period, min(missing), max(missing))
+        empty = {metric: 0.0 for metric in COUNTERS}
+        async with redis_client.pipeline(transaction=False) as pipe:
+            for start in missing:
+                totals[start] = found.get(start, empty)
+                pipe.hset(rollup_key(user_id, period, start), mapping=totals[start])
+                pipe.expire(rollup_key(user_id, period, start), ROLLUP_CACHE_TTL)
+            await pipe.execute()
+
+    return [summarize(start, totals[start]) for start in starts]
@@ -0,0 +1,79 @@
+from datetime import datetime, time, timedelta
+
+import numpy as np
+
+# Weights and targets for the daily pet stats
+SLEEP_WEIGHT = 50
+DIET_WEIGHT = 30
+EXERCISE_WEIGHT = 20
+SLEEP_TARGET_HOURS = 8
+HEALTHY_SCORE_MAX = 7
+
+
+def score(sleep_hours, meal_count, healthy_score_sum, exercise_duration, meal_per_day, exercise_goal):
+    """Computes pet stats for N users at once.
+
+    Every argument is an array-like of length N (or a scalar, broadcast to N).
+    Returns a dict of int arrays: happiness, diet, exercise, sleep (0-100).
+    """
+    sleep_hours = np.asarray(sleep_hours, dtype=np.float64)
+    meal_count = np.asarray(meal_count, dtype=np.float64)
+    healthy_score_sum = np.asarray(healthy_score_sum, dtype=np.float64)
+    exercise_duration = np.asarray(exercise_duration, dtype=np.float64)
+    meal_per_day = np.asarray(meal_per_day, dtype=np.float64)
+    exercise_goal = np.asarray(exercise_goal, dtype=np.float64)
+
+    # Users with no meals score 0 on diet; a zero goal counts as met
+    meal_ratio = np.divide(meal_count, meal_per_day, out=np.ones_like(meal_count * meal_per_day), where=meal_per_day > 0)
+    avg_healthy = np.divide(healthy_score_sum, meal_count, out=np.zeros_like(healthy_score_sum * meal_count), where=meal_count > 0)
+    diet_comp = np.minimum(meal_ratio, 1) * np.clip(avg_healthy / HEALTHY_SCORE_MAX, 0, 1)
+    diet_comp = np.where(meal_count > 0, diet_comp, 0.0)
+
+    exercise_ratio = np.divide(exercise_duration, exercise_goal, out=np.ones_like(exercise_duration * exercise_goal), where=exercise_goal > 0)
+    exercise_comp = np.clip(exercise_ratio, 0, 1)
+
+    sleep_comp = np.clip(sleep_hours / SLEEP_TARGET_HOURS, 0, 1)
+
+    happiness = SLEEP_WEIGHT * sleep_comp + DIET_WEIGHT * diet_comp + EXERCISE_WEIGHT * exercise_comp
+
+    # Truncate like int() did for the single-user formula
+    return {
+        "happiness": happiness.astype(np.int64),
+        "diet": (100 * diet_comp).astype(np.int64),
+        "exercise": (100 * exercise_comp).astype(np.int64),
+        "sleep": (100 * sleep_comp).astype(np.int64),
+    }
+
+
+def sleep_hours_until(sleep_time, wake_time):
+    # sleep_time is what activity rows hold: "HH:MM:SS[.ffffff]", an ISO datetime, or empty
+    if not sleep_time:
+        return 0.0
+    if "T" in sleep_time or " " in sleep_time.strip():
+        slept_at = datetime.fromisoformat(sleep_time)
+    else:
+        slept_at = datetime.combine(wake_time.date(), time.fromisoformat(sleep_time))
+        # Handle the case where sleep_time is from the previous day
+        if slept_at > wake_time:
+            slept_at -= timedelta(days=1)
+    return max((wake_time - slept_at).total_seconds() / 3600, 0.0)
+
+
+def columns_for(activities, pets, wake_time):
+    # Builds the score() inputs from matching lists of activity and pet dicts
+    meals = [activity["meals"] or [] for activity in activities]
+    return {
+        "sleep_hours": [sleep_hours_until(activity["sleep_time"], wake_time) for activity in activities],
+        "meal_count": [len(m) for m in meals],
+        "healthy_score_sum": [sum(meal["healthy_score"] for meal in m) for m in meals],
+        "exercise_duration": [activity["exercise_duration"] or 0 for activity in activities],
+        "meal_per_day": [pet["meal_per_day"] or 0 for pet in pets],
+        "exercise_goal": [pet["exercise_dur"] or 0 for pet in pets],
+    }
+
+
+def score_one(activity, pet, wake_time):
+    # Single user convenience wrapper, returns (stats, sleep_hours)
+    columns = columns_for([activity], [pet], wake_time)
+    stats = score(**columns)
+    return {name: int(values[0]) for name, values in stats.items()}, columns["sleep_hours"][0]
@@ -0,0 +1,27 @@
+import json
+
+from fastapi import Response
+
+try:
+    import orjson
+except ImportError:  # the stdlib encoder is used without orjson, still as bytes
+    orjson = None
+
+
+def dumps(value):
+    # JSON as bytes, ready to be stored in Redis or sent as a response body
+    if orjson is not None:
+        return orjson.dumps(value)
+    return json.dumps(value, separators=(",", ":")).encode()
+
+
+def loads(data):
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+class JSONBytesResponse(Response):
+    """Response for a body that is already encoded JSON; skips FastAPI's encoder entirely."""
+
+    media_type = "application/json"
@@ -0,0 +1,145 @@
+import os
+
+from serialization import dumps
+
+# "cassandra" (Astra + Redis, the deployed setup) or "local" (the same cache code over
+# embedded SQLite and in-process fakeredis, no network services; for tests, profiling
+# and load tests on any machine)
+STORAGE_BACKEND = os.getenv("STORAGE_BACKEND", "cassandra")
+# SQLite database for the local backend; ":memory:" keeps everything in process
+LOCAL_DB_PATH = os.getenv("LOCAL_DB_PATH", ":memory:")
+
+
+class Repository:
+    """Storage for users, pets and activities as used by the API handlers.
+
+    Values are the same plain dicts the API returns (see pet_to_dict and
+    activity_to_dict in main.py); times and dates are ISO strings.
+    """
+
+    async def start(self):
+        # Opens connections; called from the app lifespan, never at import
+        pass
+
+    async def ping(self):
+        # Raises when the backing stores are unreachable (readiness probe)
+        pass
+
+    async def close(self):
+        pass
+
+    async def create_user(self, user_id, username, email, created_at):
+        raise NotImplementedError
+
+    async def get_user(self, user_id):
+        raise NotImplementedError
+
+    async def get_user_json(self, user_id):
+        # get_user as encoded JSON bytes (None when missing), for sending as-is
+        user = await self.get_user(user_id)
+        return None if user is None else dumps(user)
+
+    async def create_pet(self, pet):
+        raise NotImplementedError
+
+    async def get_pet(self, pet_id):
+        raise NotImplementedError
+
+    async def get_pet_entry(self, pet_id):
+        # (version, encoded JSON bytes) or None: the pet as cached, with the version that
+        # tags it (cache/versions.py); every write changes the version
+        raise NotImplementedError
+
+    async def put_pet(self, pet):
+        raise NotImplementedError
+
+    async def create_activity(self, activity):
+        raise NotImplementedError
+
+    async def get_activity(self, activity_id):
+        raise NotImplementedError
+
+    async def get_activity_entry(self, activity_id):
+        raise NotImplementedError
+
+    async def get_pets(self, pet_ids):
+        # get_pet for each id, in order (None for the missing ones)
+        raise NotImplementedError
+
+    async def get_activities(self, activity_ids):
+        raise NotImplementedError
+
+    async def get_pet_and_activity(self, user_id):
+        # (pet, activity), either may be None
+        raise NotImplementedError
+
+    async def append_meal(self, activity_id, meal, day=None):
+        # Adds one meal to the activity row; with `day`, to that day's history entry too
+        raise NotImplementedError
+
+    async def patch_pet(self, pet_id, fields):
+        # Writes only `fields` ({column: value}) without reading the row first. Like any
+        # Cassandra UPDATE this is an upsert: a missing row is created with just these columns.
+        raise NotImplementedError
+
+    async def patch_activity(self, activity_id, fields, day=None):
+        # patch_pet for the activity row; with `day`, that day's history entry gets the same fields
+        raise NotImplementedError
+
+    async def save_activity(self, user_id, activity, pet=None, history=(), atomic=False):
+        # Replaces the current activity row (and the pet row when given) and records
+        # each (activity dict, sleep hours or None) in history. atomic=True applies
+        # all of it or nothing.
+        raise NotImplementedError
+
+    async def history(self, user_id, start, end, limit):
+        # Up to `limit` history entries between start and end inclusive, newest first
+        raise NotImplementedError
+
+    async def apply_rollups(self, user_id, day, change):
+        raise NotImplementedError
+
+    async def read_rollups(self, user_id, period, count, until=None):
+        raise NotImplementedError
+
+    async def claim_events(self, keys, ttl):
+        # One bool per key: True if the key was not claimed before
+        raise NotImplementedError
+
+    async def release_events(self, keys):
+        raise NotImplementedError
+
+    async def rank_pet(self, pet):
+        # Puts the pet dict's happiness on the global and friend group leaderboards
+        raise NotImplementedError
+
+    async def join_group(self, group_id, user_id):
+        raise NotImplementedError
+
+    async def leave_group(self, group_id, user_id):
+        raise NotImplementedError
+
+    async def leaderboard_top(self, group_id, k):
+        # The first k entries ({rank, user_id, pet_name, happiness}); group_id None is the global board
+        raise NotImplementedError
+
+    async def leaderboard_around(self, group_id, user_id, radius):
+        # {rank, entries} for the user and `radius` neighbours each side, or None when unranked
+        raise NotImplementedError
+
+    def cache_stats(self):
+        return {}
+
+    def instrument(self):
+        # Hooks the backend's clients into metrics.py; called once when metrics are enabled
+        pass
+
+
+def create_repository(backend=STORAGE_BACKEND):
+    if backend == "local":
+        from storage.local import LocalRepository
+        return LocalRepository(LOCAL_DB_PATH)
+    if backend == "cassandra":
+        from storage.cassandra_redis import CassandraRepository
+        return CassandraRepository()
+    raise ValueError(f"Unknown STORAGE_BACKEND {backend!r}")
@@ -0,0 +1,506 @@
+import asyncio
+import os
+from datetime import date
+
+from cassandra.query import UNSET_VALUE
+
+from cache.client import close_redis, redis_client
+from cache.local import LocalCache, listen_for_invalidations, queue_invalidation
+from cache import readthrough
+from cache.readthrough import NEGATIVE, read_through, read_through_entry, read_through_many, read_through_raw
+from cache.versions import entry, new_version
+from db.async_session import AsyncSession
+from db.connection import KEYSPACE, connect
+from db.rows import meal_values, meals_from_row
+from db.schema import bootstrap_schema
+from db.statements import StatementRegistry
+import decay
+import leaderboard
+import metrics
+import rollups
+from serialization import dumps
+from storage.base import Repository
+
+# Lifetime of the Redis copy written after every update (24 hours)
+WRITE_TTL = 86400
+# Columns a patch may touch; anything else is rejected before building a statement
+PET_FIELDS = (
+    "pet_name", "happiness", "diet", "exercise", "sleep", "wake_up_time", "sleep_time",
+    "exercise_dur", "unhealthy_food_limit", "meal_per_day", "stats_updated_at",
+)
+ACTIVITY_FIELDS = ("date", "wake_up_time", "sleep_time", "exercise_duration")
+HISTORY_FIELDS = ("wake_up_time", "sleep_time", "exercise_duration")
+
+# Merges a JSON object of fields into the cached "<version> <JSON>" entry (see
+# cache/versions.py) under a new version token, keeping its TTL. Nothing is written when
+# the key is absent (the next read loads the full row); a cached "not found", or an
+# entry from before versions, is dropped instead.
+_JSON_PATCH_IF_EXISTS = """
+local cached = redis.call('GET', KEYS[1])
+if not cached then
+    return 0
+end
+local space = string.find(cached, ' ', 1, true)
+if cached == ARGV[2] or string.find(cached, '^[%[{]') or not space then
+    redis.call('DEL', KEYS[1])
+    return 0
+end
+local value = cjson.decode(string.sub(cached, space + 1))
+for field, v in pairs(cjson.decode(ARGV[1])) do
+    value[field] = v
+end
+-- A pet keeps the stats time in its version unless the patch moved it
+local version = ARGV[3]
+local stats_updated_at = value['stats_updated_at']
+if type(stats_updated_at) == 'string' then
+    version = version .. '@' .. stats_updated_at
+end
+-- cjson cannot tell an empty array from an empty object
+local encoded = string.gsub(cjson.encode(value), '"meals":{}', '"meals":[]')
+redis.call('SET', KEYS[1], version .. ' ' .. encoded, 'KEEPTTL')
+return 1
+"""
+
+# Redis connections opened at startup so the first requests skip the handshake
+REDIS_WARM_CONNECTIONS = int(os.getenv("REDIS_WARM_CONNECTIONS", "4"))
+# Schema changes belong to the deploy (`python -m db.schema`): every worker running the
+# DDL on boot waits for schema agreement on Astra. Set to 1 to do it at startup anyway
+# (a fresh development keyspace).
+CASSANDRA_BOOTSTRAP_SCHEMA = os.getenv("CASSANDRA_BOOTSTRAP_SCHEMA", "0") == "1"
+
+
+def pet_params(pet):
+    # Bind values for the update_pet statement
+    return (
+        pet["pet_name"],
+        pet["happiness"],
+        pet["diet"],
+        pet["exercise"],
+        pet["sleep"],
+        pet["wake_up_time"],
+        pet["sleep_time"],
+        pet["exercise_dur"],
+        pet["unhealthy_food_limit"],
+        pet["meal_per_day"],
+        decay.parse(pet.get("stats_updated_at")),
+        pet["pet_id"]
+    )
+
+
+def activity_params(activity_id, activity):
+    # Bind values for the update_activity statement
+    return (
+        date.fromisoformat(str(activity["date"])),
+        activity["wake_up_time"],  # TEXT columns
+        activity["sleep_time"],
+        activity["exercise_duration"],
+        meal_values(activity["meals"]),
+        activity_id
+    )
+
+
+def history_params(user_id, activity, sleep_hours=None):
+    # Bind values for insert_history from an activity dict
+    day = date.fromisoformat(str(activity["date"]))
+    return (
+        user_id,
+        day.year,
+        day,
+        activity["wake_up_time"],
+        activity["sleep_time"],
+        activity["exercise_duration"],
+        None,  # legacy JSON meals, superseded by meal_log
+        meal_values(activity["meals"]),
+        sleep_hours if sleep_hours is not None else UNSET_VALUE  # keep the value set_wake recorded
+    )
+
+
+class CassandraRepository(Repository):
+    """Astra/Cassandra rows behind Redis and an in-process tier, kept coherent via pub/sub.
+
+    Rows are only touched through the _start_rows / _load_* / _insert_* / _update_* /
+    _write_* methods; caching, leaderboards and event claims are Redis. The local backend
+    (storage/local.py) swaps just those row methods for SQLite.
+    """
+
+    def __init__(self, keyspace=KEYSPACE, connect=connect):
+        # Nothing connects here: start() runs in the app lifespan, after any worker fork
+        self.keyspace = keyspace
+        self._connect = connect
+        self.cluster = None
+        self.session = None
+        self.db = None
+        self.statements = None
+        self.redis = redis_client
+        # In-process tier in front of the pet_stats:* and activity:* keys
+        self.local_cache = LocalCache()
+        self._listener = None
+        self._instrumented = False
+        self._patch_json = self.redis.register_script(_JSON_PATCH_IF_EXISTS)
+
+    async def start(self):
+        # The row store (connect, schema, prepared statements) and the Redis pool warm up concurrently
+        await asyncio.gather(self._start_rows(), self._warm_redis())
+        self._listener = asyncio.create_task(listen_for_invalidations(self.redis, self.local_cache))
+
+    async def _start_rows(self):
+        # The driver's connect and prepare calls block, so they run off the event loop
+        self.cluster, self.session = await asyncio.to_thread(self._connect)
+        # Non-blocking access for the handlers, bounded by CASSANDRA_MAX_IN_FLIGHT per worker
+        self.db = AsyncSession(self.session)
+        # Prepared once at startup, reused by every request
+        self.statements = StatementRegistry(self.session, self.keyspace)
+        if self._instrumented:
+            metrics.instrument_session(self.db, self.statements)
+        if CASSANDRA_BOOTSTRAP_SCHEMA:
+            await asyncio.to_thread(bootstrap_schema, self.session, self.keyspace)
+        await self.statements.prepare_all()
+
+    async def _warm_redis(self):
+        await asyncio.gather(*(self.redis.ping() for _ in range(REDIS_WARM_CONNECTIONS)))
+
+    async def ping(self):
+        await asyncio.gather(self._ping_rows(), self.redis.ping())
+
+    async def _ping_rows(self):
+        await self.db.execute("SELECT release_version FROM system.local")
+
+    async def close(self):
+        if self._listener is not None:
+            self._listener.cancel()
+        await close_redis()
+        await self._close_rows()
+
+    async def _close_rows(self):
+        if self.cluster is not None:
+            await asyncio.to_thread(self.cluster.shutdown)
+
+    async def _forget(self, *keys):
+        # Drops cached copies (including cached "not found" entries) everywhere
+        async with self.redis.pipeline(transaction=False) as pipe:
+            pipe.delete(*keys)
+            queue_invalidation(pipe, *keys)
+            await pipe.execute()
+        for key in keys:
+            self.local_cache.delete(key)
+
+    async def _remember(self, values):
+        # New values (each under a new version) for {key: value} plus the invalidations, in one round trip
+        async with self.redis.pipeline(transaction=False) as pipe:
+            for key, value in values.items():
+                pipe.set(key, entry(new_version(value), dumps(value)), ex=WRITE_TTL)
+            queue_invalidation(pipe, *values)
+            await pipe.execute()
+        for key in values:
+            self.local_cache.delete(key)
+
+    async def _patch(self, key, fields):
+        # The cached document patched in place (no full reserialization)
+        async with self.redis.pipeline(transaction=False) as pipe:
+            await self._patch_json(keys=[key], args=[dumps(fields), NEGATIVE, new_version()], client=pipe)
+            queue_invalidation(pipe, key)
+            await pipe.execute()
+        self.local_cache.delete(key)
+
+    async def create_user(self, user_id, username, email, created_at):
+        await self._insert_user(user_id, username, email, created_at)
+        await self._forget(f"user:{user_id}")
+
+    async def _insert_user(self, user_id, username, email, created_at):
+        await self.db.execute(self.statements["insert_user"], (user_id, username, email, created_at))
+
+    async def _load_user(self, user_id):
+        row = (await self.db.execute(self.statements["select_user"], (user_id,))).one()
+        if not row:
+            return None
+        return {
+            "id": row.id,
+            "username": row.username,
+            "email": row.email,
+        }
+
+    async def get_user(self, user_id):
+        return await read_through(self.redis, f"user:{user_id}", lambda: self._load_user(user_id))
+
+    async def get_user_json(self, user_id):
+        return await read_through_raw(self.redis, f"user:{user_id}", lambda: self._load_user(user_id))
+
+    async def create_pet(self, pet):
+        await self._insert_pet(pet)
+        await self._forget(f"pet_stats:{pet['pet_id']}")
+
+    async def _insert_pet(self, pet):
+        await self.db.execute(self.statements["insert_pet"], (
+            pet["pet_id"],
+            pet["pet_name"],
+            pet["happiness"],
+            pet["diet"],
+            pet["exercise"],
+            pet["sleep"],
+            pet["exercise_dur"],
+            pet["wake_up_time"],
+            pet["sleep_time"],
+            pet["unhealthy_food_limit"],
+            pet["meal_per_day"],
+            decay.parse(pet.get("stats_updated_at"))
+        ))
+
+    async def _load_pet(self, pet_id):
+        pet_row = (await self.db.execute(self.statements["select_pet"], (pet_id,))).one()
+        if not pet_row:
+            return None
+        return {
+            "pet_id": pet_row.pet_id,
+            "pet_name": pet_row.pet_name,
+            "happiness": pet_row.happiness,
+            "diet": pet_row.diet,
+            "exercise": pet_row.exercise,
+            "sleep": pet_row.sleep,
+            "wake_up_time": str(pet_row.wake_up_time),
+            "sleep_time": str(pet_row.sleep_time),
+            "exercise_dur": pet_row.exercise_dur,
+            "unhealthy_food_limit": pet_row.unhealthy_food_limit,
+            "meal_per_day": pet_row.meal_per_day,
+            "stats_updated_at": decay.stamp(pet_row.stats_updated_at) if pet_row.stats_updated_at else None
+        }
+
+    async def get_pet(self, pet_id):
+        # Served from the local tier or Redis when cached, otherwise loaded once even under concurrent requests
+        return await read_through(self.redis, f"pet_stats:{pet_id}", lambda: self._load_pet(pet_id), local=self.local_cache)
+
+    async def get_pet_entry(self, pet_id):
+        return await read_through_entry(self.redis, f"pet_stats:{pet_id}", lambda: self._load_pet(pet_id), local=self.local_cache)
+
+    async def put_pet(self, pet):
+        await self._update_pet(pet)
+        await self._remember({f"pet_stats:{pet['pet_id']}": pet})
+
+    async def _update_pet(self, pet):
+        await self.db.execute(self.statements["update_pet"], pet_params(pet))
+
+    async def create_activity(self, activity):
+        await self._insert_activity(activity)
+        await self._forget(f"activity:{activity['activity_id']}")
+
+    async def _insert_activity(self, activity):
+        await self.db.execute(self.statements["insert_activity"], (
+            activity["activity_id"],
+            date.fromisoformat(activity["date"]),
+            activity["wake_up_time"] or "",
+            activity["sleep_time"] or "",
+            activity["exercise_duration"],
+            meal_values(activity["meals"])
+        ))
+
+    async def _load_activity(self, activity_id):
+        activity_row = (await self.db.execute(self.statements["select_activity"], (activity_id,))).one()
+        if not activity_row:
+            return None
+        return {
+            "activity_id": activity_row.activity_id,
+            "date": str(activity_row.date),
+            "wake_up_time": activity_row.wake_up_time if activity_row.wake_up_time else None,
+            "sleep_time": activity_row.sleep_time if activity_row.sleep_time else None,
+            "exercise_duration": activity_row.exercise_duration,
+            "meals": meals_from_row(activity_row)
+        }
+
+    async def get_activity(self, activity_id):
+        return await read_through(self.redis, f"activity:{activity_id}", lambda: self._load_activity(activity_id), local=self.local_cache)
+
+    async def get_activity_entry(self, activity_id):
+        return await read_through_entry(
+            self.redis, f"activity:{activity_id}", lambda: self._load_activity(activity_id), local=self.local_cache
+        )
+
+    async def get_pets(self, pet_ids):
+        # Local tier, then one MGET for all of them, then concurrent Cassandra reads
+        return await read_through_many(self.redis, {
+            f"pet_stats:{pet_id}": lambda pet_id=pet_id: self._load_pet(pet_id) for pet_id in pet_ids
+        }, local=self.local_cache)
+
+    async def get_activities(self, activity_ids):
+        return await read_through_many(self.redis, {
+            f"activity:{activity_id}": lambda activity_id=activity_id: self._load_activity(activity_id)
+            for activity_id in activity_ids
+        }, local=self.local_cache)
+
+    async def get_pet_and_activity(self, user_id):
+        # Local tier, then one MGET, then concurrent Cassandra reads
+        pet, activity = await read_through_many(self.redis, {
+            f"pet_stats:{user_id}": lambda: self._load_pet(user_id),
+            f"activity:{user_id}": lambda: self._load_activity(user_id),
+        }, local=self.local_cache)
+        return pet, activity
+
+    async def append_meal(self, activity_id, meal, day=None):
+        # Blind append to the meal list: no read of the activity row, no full rewrite.
+        # With `day` the meal also goes onto that day's history row, like patch_activity.
+        # The cached copy is now behind, so it is dropped and the next read refills it.
+        await self._append_meal(activity_id, meal, day)
+        await self._forget(f"activity:{activity_id}")
+
+    async def _append_meal(self, activity_id, meal, day=None):
+        writes = [(self.statements["append_meal"], (meal_values([meal]), activity_id))]
+        if day is not None:
+            day = date.fromisoformat(str(day))
+            writes.append((self.statements["append_history_meal"], (meal_values([meal]), activity_id, day.year, day)))
+        await self.db.execute_many(writes)
+
+    async def patch_pet(self, pet_id, fields):
+        unknown = set(fields) - set(PET_FIELDS)
+        if unknown:
+            raise ValueError(f"Cannot patch pet fields {sorted(unknown)}")
+        # The partial UPDATE, then the cached copy
+        await self._update_pet_columns(pet_id, fields)
+        await self._patch(f"pet_stats:{pet_id}", fields)
+
+    async def _update_pet_columns(self, pet_id, fields):
+        columns = sorted(fields)
+        statement = await self.statements.update("petspace", columns, ("pet_id",))
+        params = tuple(
+            decay.parse(fields[column]) if column == "stats_updated_at" else fields[column] for column in columns
+        ) + (pet_id,)
+        await self.db.execute(statement, params)
+
+    async def patch_activity(self, activity_id, fields, day=None):
+        unknown = set(fields) - set(ACTIVITY_FIELDS)
+        if unknown:
+            raise ValueError(f"Cannot patch activity fields {sorted(unknown)}")
+        await self._update_activity_columns(activity_id, fields, day)
+        await self._patch(f"activity:{activity_id}", fields)
+
+    async def _update_activity_columns(self, activity_id, fields, day=None):
+        columns = sorted(fields)
+        values = {column: date.fromisoformat(str(fields[column])) if column == "date" else fields[column] for column in columns}
+        writes = [(
+            await self.statements.update("activityspace", columns, ("activity_id",)),
+            tuple(values[column] for column in columns) + (activity_id,)
+        )]
+        history_columns = [column for column in columns if column in HISTORY_FIELDS]
+        if day is not None and history_columns:
+            day = date.fromisoformat(str(day))
+            writes.append((
+                await self.statements.update("activity_history", history_columns, ("user_id", "year", "date")),
+                tuple(values[column] for column in history_columns) + (activity_id, day.year, day)
+            ))
+        await self.db.execute_many(writes)
+
+    async def save_activity(self, user_id, activity, pet=None, history=(), atomic=False):
+        await self._write_activity(user_id, activity, pet, history, atomic)
+        cached = {f"activity:{user_id}": activity}
+        if pet is not None:
+            cached[f"pet_stats:{user_id}"] = pet
+        await self._remember(cached)
+
+    async def _write_activity(self, user_id, activity, pet, history, atomic):
+        writes = [(self.statements["update_activity"], activity_params(user_id, activity))]
+        writes += [(self.statements["insert_history"], history_params(user_id, day, hours)) for day, hours in history]
+        if pet is not None:
+            writes.append((self.statements["update_pet"], pet_params(pet)))
+        if atomic:
+            # All rows in one logged batch
+            await self.db.execute_batch(writes)
+        else:
+            # Independent rows, written concurrently
+            await self.db.execute_many(writes)
+
+    async def history(self, user_id, start, end, limit):
+        items = []
+        # One partition per year; a range only spans several around New Year
+        for year in range(end.year, start.year - 1, -1):
+            rows = await self.db.execute(self.statements["select_history"], (
+                user_id,
+                year,
+                max(start, date(year, 1, 1)),
+                min(end, date(year, 12, 31)),
+                limit - len(items)
+            ))
+            items.extend({
+                "date": str(row.date),
+                "wake_up_time": row.wake_up_time or None,
+                "sleep_time": row.sleep_time or None,
+                "exercise_duration": row.exercise_duration,
+                "meals": meals_from_row(row),
+                "sleep_hours": row.sleep_hours
+            } for row in rows)
+            if len(items) >= limit:
+                break
+        return items
+
+    async def apply_rollups(self, user_id, day, change):
+        await rollups.apply(self.redis, self._increment_rollups, user_id, day, change)
+
+    async def _increment_rollups(self, user_id, starts, params):
+        await self.db.execute_many(
+            (self.statements["increment_rollup"], params + (user_id, period, start))
+            for period, start in starts.items()
+        )
+
+    async def read_rollups(self, user_id, period, count, until=None):
+        return await rollups.read(self.redis, self._load_rollups, user_id, period, count, until)
+
+    async def _load_rollups(self, user_id, period, first, last):
+        # All periods of one kind live in one partition: a single slice covers them
+        rows = await self.db.execute(self.statements["select_rollups"], (user_id, period, first, last))
+        return {date.fromisoformat(str(row.period_start)): rollups.from_counters(row) for row in rows}
+
+    async def claim_events(self, keys, ttl):
+        # Every key in one round trip
+        async with self.redis.pipeline(transaction=False) as pipe:
+            for key in keys:
+                pipe.set(key, 1, nx=True, ex=ttl)
+            return [bool(claimed) for claimed in await pipe.execute()]
+
+    async def release_events(self, keys):
+        if keys:
+            await self.redis.delete(*keys)
+
+    async def _load_groups(self, user_id):
+        rows = await self.db.execute(self.statements["select_user_groups"], (user_id,))
+        return [row.group_id for row in rows]
+
+    async def rank_pet(self, pet):
+        # Group memberships are cached like any row, so ranking costs no Cassandra read
+        group_ids = await read_through(
+            self.redis, f"friend_groups:{pet['pet_id']}", lambda: self._load_groups(pet["pet_id"]), local=self.local_cache
+        )
+        await leaderboard.record(self.redis, pet, group_ids or [])
+
+    async def join_group(self, group_id, user_id):
+        await self._insert_group_member(group_id, user_id)
+        await self._forget(f"friend_groups:{user_id}")
+        await leaderboard.join(self.redis, group_id, user_id)
+
+    async def _insert_group_member(self, group_id, user_id):
+        await self.db.execute(self.statements["insert_group_member"], (user_id, group_id))
+
+    async def leave_group(self, group_id, user_id):
+        await self._delete_group_member(group_id, user_id)
+        await self._forget(f"friend_groups:{user_id}")
+        await leaderboard.leave(self.redis, group_id, user_id)
+
+    async def _delete_group_member(self, group_id, user_id):
+        await self.db.execute(self.statements["delete_group_member"], (user_id, group_id))
+
+    async def leaderboard_top(self, group_id, k):
+        return await leaderboard.top(self.redis, group_id, k)
+
+    async def leaderboard_around(self, group_id, user_id, radius):
+        return await leaderboard.around(self.redis, group_id, user_id, radius)
+
+    def cache_stats(self):
+        return self.local_cache.stats()
+
+    def instrument(self):
+        # The session wrapper is applied in start(), once the session exists
+        self._instrumented = True
+        metrics.instrument_redis(self.redis)
+        metrics.register_collector(lambda: metrics.record_cache("local", self.local_cache.stats()))
+        metrics.register_collector(self._record_redis_tier)
+
+    def _record_redis_tier(self):
+        hits, misses = readthrough.lookups["redis_hits"], readthrough.lookups["redis_misses"]
+        metrics.cache_hits.set(hits, "redis", "redis")
+        metrics.cache_misses.set(misses, "redis")
+        metrics.cache_hit_ratio.set(hits / (hits + misses) if hits + misses else 0.0, "redis")
@@ -0,0 +1,292 @@
+import json
+import sqlite3
+from datetime import date
+
+import rollups
+from storage.cassandra_redis import HISTORY_FIELDS, CassandraRepository
+
+# Same tables as db/schema.py, flattened for SQLite. Meal lists are stored as JSON.
+TABLES = [
+    """
+    CREATE TABLE IF NOT EXISTS users (
+        id INTEGER PRIMARY KEY,
+        username TEXT,
+        email TEXT,
+        created_at TEXT
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS pets (
+        pet_id INTEGER PRIMARY KEY,
+        pet_name TEXT,
+        happiness INTEGER,
+        diet INTEGER,
+        exercise INTEGER,
+        sleep INTEGER,
+        exercise_dur REAL,
+        wake_up_time TEXT,
+        sleep_time TEXT,
+        unhealthy_food_limit INTEGER,
+        meal_per_day INTEGER,
+        stats_updated_at TEXT
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS activities (
+        activity_id INTEGER PRIMARY KEY,
+        date TEXT,
+        wake_up_time TEXT,
+        sleep_time TEXT,
+        exercise_duration REAL,
+        meals TEXT
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS history (
+        user_id INTEGER,
+        date TEXT,
+        wake_up_time TEXT,
+        sleep_time TEXT,
+        exercise_duration REAL,
+        meals TEXT,
+        sleep_hours REAL,
+        PRIMARY KEY (user_id, date)
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS rollups (
+        user_id INTEGER,
+        period TEXT,
+        period_start TEXT,
+        exercise_milli INTEGER DEFAULT 0,
+        meals INTEGER DEFAULT 0,
+        healthy_score INTEGER DEFAULT 0,
+        sleep_milli_hours INTEGER DEFAULT 0,
+        nights INTEGER DEFAULT 0,
+        PRIMARY KEY (user_id, period, period_start)
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS friend_groups (
+        group_id TEXT,
+        user_id INTEGER,
+        PRIMARY KEY (group_id, user_id)
+    )
+    """,
+]
+# Columns added after the first release, for database files created before them
+COLUMNS = [
+    ("pets", "stats_updated_at", "TEXT"),
+]
+
+PET_COLUMNS = (
+    "pet_id", "pet_name", "happiness", "diet", "exercise", "sleep", "exercise_dur",
+    "wake_up_time", "sleep_time", "unhealthy_food_limit", "meal_per_day", "stats_updated_at",
+)
+ACTIVITY_COLUMNS = ("activity_id", "date", "wake_up_time", "sleep_time", "exercise_duration", "meals")
+COUNTER_COLUMNS = [column for column, _ in rollups.COUNTERS.values()]
+
+
+def _upsert(table, columns, key):
+    updates = ", ".join(f"{column} = excluded.{column}" for column in columns if column not in key)
+    return (
+        f"INSERT INTO {table} ({', '.join(columns)}) VALUES ({', '.join('?' for _ in columns)}) "
+        f"ON CONFLICT ({', '.join(key)}) DO UPDATE SET {updates}"
+    )
+
+
+UPSERT_PET = _upsert("pets", PET_COLUMNS, ("pet_id",))
+UPSERT_ACTIVITY = _upsert("activities", ACTIVITY_COLUMNS, ("activity_id",))
+# Like insert_history: a None sleep_hours keeps the value set_wake recorded
+UPSERT_HISTORY = _upsert(
+    "history",
+    ("user_id", "date", "wake_up_time", "sleep_time", "exercise_duration", "meals", "sleep_hours"),
+    ("user_id", "date"),
+).replace("sleep_hours = excluded.sleep_hours", "sleep_hours = COALESCE(excluded.sleep_hours, history.sleep_hours)")
+APPEND_HISTORY_MEAL = (
+    "INSERT INTO history (user_id, date, meals) VALUES (?, ?, ?) ON CONFLICT (user_id, date) "
+    "DO UPDATE SET meals = json_insert(COALESCE(history.meals, '[]'), '$[#]', json(?))"
+)
+INCREMENT_ROLLUP = (
+    f"INSERT INTO rollups (user_id, period, period_start, {', '.join(COUNTER_COLUMNS)}) VALUES (?, ?, ?, ?, ?, ?, ?, ?) "
+    f"ON CONFLICT (user_id, period, period_start) DO UPDATE SET "
+    + ", ".join(f"{column} = {column} + excluded.{column}" for column in COUNTER_COLUMNS)
+)
+
+
+def _activity(row):
+    return {
+        "activity_id": row["activity_id"],
+        "date": row["date"],
+        "wake_up_time": row["wake_up_time"] or None,
+        "sleep_time": row["sleep_time"] or None,
+        "exercise_duration": row["exercise_duration"],
+        "meals": json.loads(row["meals"]) if row["meals"] else [],
+    }
+
+
+def _activity_values(activity_id, activity):
+    return (
+        activity_id,
+        str(activity["date"]),
+        activity["wake_up_time"],
+        activity["sleep_time"],
+        activity["exercise_duration"],
+        json.dumps(activity["meals"] or []),
+    )
+
+
+def _upsert_columns(table, keys, columns):
+    # Partial upsert like a Cassandra UPDATE: only `columns` are set on an existing row,
+    # and a missing row is created. Binds the key values first, then the columns.
+    return (
+        f"INSERT INTO {table} ({', '.join(keys + tuple(columns))}) VALUES ({', '.join('?' for _ in keys + tuple(columns))}) "
+        f"ON CONFLICT ({', '.join(keys)}) DO UPDATE SET {', '.join(f'{column} = excluded.{column}' for column in columns)}"
+    )
+
+
+class LocalRepository(CassandraRepository):
+    """CassandraRepository over embedded SQLite rows and in-process Redis (fakeredis,
+    see cache/client.py); needs no network services.
+
+    Only the row methods differ, so requests run the deployed cache paths (read-through,
+    single-flight, the local tier, Lua patches, pipelines, pub/sub) and profiles or
+    bench.load runs on any machine show them. Queries run directly on the event loop
+    thread: they are sub-millisecond against a local file or ":memory:".
+    """
+
+    def __init__(self, path=":memory:"):
+        super().__init__()
+        self.path = path
+        self.conn = None
+
+    async def _start_rows(self):
+        self.conn = sqlite3.connect(self.path, isolation_level=None, check_same_thread=False)
+        self.conn.row_factory = sqlite3.Row
+        if self.path != ":memory:":
+            self.conn.execute("PRAGMA journal_mode = WAL")
+            self.conn.execute("PRAGMA synchronous = NORMAL")
+        for ddl in TABLES:
+            self.conn.execute(ddl)
+        for table, column, sql_type in COLUMNS:
+            if column not in {row["name"] for row in self.conn.execute(f"PRAGMA table_info({table})")}:
+                self.conn.execute(f"ALTER TABLE {table} ADD COLUMN {column} {sql_type}")
+
+    async def _ping_rows(self):
+        self.conn.execute("SELECT 1")
+
+    async def _close_rows(self):
+        if self.conn is not None:
+            self.conn.close()
+
+    def _one(self, query, params):
+        return self.conn.execute(query, params).fetchone()
+
+    async def _insert_user(self, user_id, username, email, created_at):
+        self.conn.execute(
+            "INSERT OR REPLACE INTO users (id, username, email, created_at) VALUES (?, ?, ?, ?)",
+            (user_id, username, email, str(created_at)),
+        )
+
+    async def _load_user(self, user_id):
+        row = self._one("SELECT id, username, email FROM users WHERE id = ?", (user_id,))
+        return dict(row) if row else None
+
+    async def _insert_pet(self, pet):
+        await self._update_pet(pet)
+
+    async def _load_pet(self, pet_id):
+        row = self._one(f"SELECT {', '.join(PET_COLUMNS)} FROM pets WHERE pet_id = ?", (pet_id,))
+        return dict(row) if row else None
+
+    async def _update_pet(self, pet):
+        self.conn.execute(UPSERT_PET, tuple(pet[column] for column in PET_COLUMNS))
+
+    async def _insert_activity(self, activity):
+        self.conn.execute(UPSERT_ACTIVITY, _activity_values(activity["activity_id"], activity))
+
+    async def _load_activity(self, activity_id):
+        row = self._one(f"SELECT {', '.join(ACTIVITY_COLUMNS)} FROM activities WHERE activity_id = ?", (activity_id,))
+        return _activity(row) if row else None
+
+    async def _append_meal(self, activity_id, meal, day=None):
+        with self.conn:
+            self.conn.execute("BEGIN")
+            self.conn.execute(
+                "UPDATE activities SET meals = json_insert(COALESCE(meals, '[]'), '$[#]', json(?)) WHERE activity_id = ?",
+                (json.dumps(meal), activity_id),
+            )
+            if day is not None:
+                # Creates the history row if needed, as the Cassandra UPDATE does
+                self.conn.execute(APPEND_HISTORY_MEAL, (activity_id, str(day), json.dumps([meal]), json.dumps(meal)))
+
+    async def _update_pet_columns(self, pet_id, fields):
+        columns = sorted(fields)
+        self.conn.execute(_upsert_columns("pets", ("pet_id",), columns), (pet_id,) + tuple(fields[column] for column in columns))
+
+    async def _update_activity_columns(self, activity_id, fields, day=None):
+        columns = sorted(fields)
+        values = tuple(str(fields[column]) if column == "date" else fields[column] for column in columns)
+        with self.conn:
+            self.conn.execute("BEGIN")
+            self.conn.execute(_upsert_columns("activities", ("activity_id",), columns), (activity_id,) + values)
+            history_columns = [column for column in columns if column in HISTORY_FIELDS]
+            if day is not None and history_columns:
+                self.conn.execute(
+                    _upsert_columns("history", ("user_id", "date"), history_columns),
+                    (activity_id, str(day)) + tuple(fields[column] for column in history_columns),
+                )
+
+    async def _write_activity(self, user_id, activity, pet, history, atomic):
+        # A single SQLite transaction either way
+        with self.conn:
+            self.conn.execute("BEGIN")
+            self.conn.execute(UPSERT_ACTIVITY, _activity_values(user_id, activity))
+            for day, hours in history:
+                self.conn.execute(UPSERT_HISTORY, (user_id,) + _activity_values(user_id, day)[1:] + (hours,))
+            if pet is not None:
+                self.conn.execute(UPSERT_PET, tuple(pet[column] for column in PET_COLUMNS))
+
+    async def history(self, user_id, start, end, limit):
+        rows = self.conn.execute(
+            "SELECT date, wake_up_time, sleep_time, exercise_duration, meals, sleep_hours FROM history "
+            "WHERE user_id = ? AND date >= ? AND date <= ? ORDER BY date DESC LIMIT ?",
+            (user_id, start.isoformat(), end.isoformat(), limit),
+        )
+        return [{
+            "date": row["date"],
+            "wake_up_time": row["wake_up_time"] or None,
+            "sleep_time": row["sleep_time"] or None,
+            "exercise_duration": row["exercise_duration"],
+            "meals": json.loads(row["meals"]) if row["meals"] else [],
+            "sleep_hours": row["sleep_hours"],
+        } for row in rows]
+
+    async def _increment_rollups(self, user_id, starts, params):
+        with self.conn:
+            self.conn.execute("BEGIN")
+            self.conn.executemany(INCREMENT_ROLLUP, [
+                (user_id, period, start.isoformat()) + params for period, start in starts.items()
+            ])
+
+    async def _load_rollups(self, user_id, period, first, last):
+        rows = self.conn.execute(
+            f"SELECT period_start, {', '.join(COUNTER_COLUMNS)} FROM rollups "
+            "WHERE user_id = ? AND period = ? AND period_start >= ? AND period_start <= ?",
+            (user_id, period, first.isoformat(), last.isoformat()),
+        )
+        return {
+            date.fromisoformat(row["period_start"]): {
+                metric: (row[column] or 0) / scale for metric, (column, scale) in rollups.COUNTERS.items()
+            }
+            for row in rows
+        }
+
+    async def _load_groups(self, user_id):
+        return [row["group_id"] for row in self.conn.execute("SELECT group_id FROM friend_groups WHERE user_id = ?", (user_id,))]
+
+    async def _insert_group_member(self, group_id, user_id):
+        self.conn.execute("INSERT OR IGNORE INTO friend_groups (group_id, user_id) VALUES (?, ?)", (group_id, user_id))
+
+    async def _delete_group_member(self, group_id, user_id):
+        self.conn.execute("DELETE FROM friend_groups WHERE group_id = ? AND user_id = ?", (group_id, user_id))
@@ -0,0 +1,47 @@
+import os
+import sys
+
+import pytest
+
+# The app runs on the local backend: SQLite rows and fakeredis under the same cache
+# code as production, so no services are needed. Set before main is imported.
+os.environ["STORAGE_BACKEND"] = "local"
+os.environ["LOCAL_DB_PATH"] = ":memory:"
+os.environ["FOOD_WARMUP"] = "0"
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+USER = {
+    "username": "tester",
+    "email": "tester@example.com",
+    "exercise_dur": 1.0,
+    "wake_up_time": "07:00:00",
+    "sleep_time": "23:00:00",
+    "unhealthy_food_limit": 2,
+    "meal_per_day": 3,
+}
+
+
+@pytest.fixture
+def app():
+    import main
+    return main
+
+
+@pytest.fixture
+def client(app):
+    from fastapi.testclient import TestClient
+
+    # Each app start opens a fresh in-memory database; Redis is emptied by hand
+    with TestClient(app.app) as client:
+        client.portal.call(app.repo.redis.flushall)
+        app.repo.local_cache.clear()
+        yield client
+
+
+@pytest.fixture
+def create_user(client):
+    def create(user_id):
+        response = client.post("/user", json=dict(USER, id=user_id, username=f"tester{user_id}"))
+        assert response.status_code == 200
+        return user_id
+    return create
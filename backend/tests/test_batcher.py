@@ -0,0 +1,40 @@
+import asyncio
+
+import pytest
+
+from food.batcher import MicroBatcher, Overloaded
+
+
+def test_submissions_beyond_max_pending_are_refused():
+    async def scenario():
+        release = asyncio.Event()
+
+        async def run_batch(items):
+            await release.wait()
+            return [item * 2 for item in items]
+
+        batcher = MicroBatcher(run_batch, max_batch_size=2, window_ms=1, max_pending=4)
+        accepted = [asyncio.create_task(batcher.submit(i)) for i in range(4)]
+        await asyncio.sleep(0.01)
+
+        assert batcher.full()
+        with pytest.raises(Overloaded):
+            await batcher.submit(99)
+        assert batcher.stats()["rejected"] == 1
+
+        release.set()
+        assert await asyncio.gather(*accepted) == [0, 2, 4, 6]
+        # Capacity is back once the queued images are done
+        assert not batcher.full()
+        assert await batcher.submit(5) == 10
+        await batcher.close()
+
+    asyncio.run(scenario())
+
+
+def test_full_queue_answers_503_before_reading_the_upload(app, client, monkeypatch):
+    monkeypatch.setattr(app.food_batcher, "max_pending", 0)
+
+    response = client.post("/analyse-food", files={"file": ("meal.jpg", b"not read", "image/jpeg")})
+    assert response.status_code == 503
+    assert response.headers["Retry-After"] == "1"
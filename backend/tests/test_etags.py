@@ -0,0 +1,72 @@
+from datetime import timedelta
+
+import pytest
+
+import decay
+
+WRITES = [
+    ("patch", "/user/pet/1", {"json": {"pet_name": "Mochi"}}, "pet"),
+    ("patch", "/user/pet/1", {"json": {"happiness": 70}}, "pet"),
+    ("post", "/user/1/activity/wake", {}, "pet"),
+    ("patch", "/user/activity/1", {"json": {"wake_up_time": "06:30:00"}}, "activity"),
+    ("post", "/user/1/activity/meal", {"json": {"meal_name": "apple", "healthy_score": 8}}, "activity"),
+]
+
+
+def tagged(client, path, etag=None):
+    response = client.get(path, headers={"If-None-Match": etag} if etag else {})
+    assert response.status_code in (200, 304)
+    return response
+
+
+@pytest.mark.parametrize("kind", ["pet", "activity"])
+def test_unchanged_document_answers_304(app, client, create_user, kind):
+    create_user(1)
+    etag = tagged(client, f"/user/{kind}/1").headers["ETag"]
+
+    assert tagged(client, f"/user/{kind}/1", etag).status_code == 304
+    # Redis answers once the worker's copy is gone, with the version it stored
+    app.repo.local_cache.clear()
+    response = tagged(client, f"/user/{kind}/1", etag)
+    assert response.status_code == 304
+    assert response.headers["ETag"] == etag
+
+
+@pytest.mark.parametrize("method,path,kwargs,kind", WRITES)
+def test_write_changes_the_tag(client, create_user, method, path, kwargs, kind):
+    create_user(1)
+    etag = tagged(client, f"/user/{kind}/1").headers["ETag"]
+
+    assert getattr(client, method)(path, **kwargs).status_code == 200
+    response = tagged(client, f"/user/{kind}/1", etag)
+    assert response.status_code == 200
+    assert response.headers["ETag"] != etag
+    # The new tag is stable until the next write
+    assert tagged(client, f"/user/{kind}/1", response.headers["ETag"]).status_code == 304
+
+
+def test_pet_tag_changes_once_a_decay_point_wears_off(client, create_user, monkeypatch):
+    create_user(1)
+    response = tagged(client, "/user/pet/1")
+    etag, stored = response.headers["ETag"], response.json()
+
+    # Less than a point of any stat later the pet reads the same
+    later = decay.now() + timedelta(minutes=5)
+    monkeypatch.setattr(decay, "now", lambda: later)
+    assert tagged(client, "/user/pet/1", etag).status_code == 304
+
+    later = later + timedelta(hours=1)
+    response = tagged(client, "/user/pet/1", etag)
+    assert response.status_code == 200
+    assert response.headers["ETag"] != etag
+    assert response.json()["happiness"] == stored["happiness"] - 1
+
+
+def test_batch_reads_match_single_reads_and_list_missing_ids(client, create_user):
+    for user_id in (1, 2):
+        create_user(user_id)
+
+    for kind, plural in (("pet", "pets"), ("activity", "activities")):
+        batch = client.get(f"/user/{plural}", params={"ids": [1, 9, 2]}).json()
+        assert batch["items"] == [client.get(f"/user/{kind}/{user_id}").json() for user_id in (1, 2)]
+        assert batch["missing"] == [9]
@@ -0,0 +1,48 @@
+import asyncio
+
+import pytest
+
+from food import cache
+from food.cache import ClassificationCache
+
+SALAD = {"label": "salad", "confidence": 0.9, "healthy_score": 8}
+
+
+@pytest.fixture
+def perceptual(monkeypatch):
+    monkeypatch.setattr(cache, "FOOD_PERCEPTUAL_HASH", True)
+
+
+def test_exact_reupload_is_not_hashed(perceptual):
+    async def scenario():
+        classifications = ClassificationCache(None)
+        await classifications.set("abc", "0f0f", SALAD)
+        hashed = []
+
+        async def phash():
+            hashed.append(1)
+            return "0f0f"
+
+        assert await classifications.get("abc", phash) == (SALAD, None)
+        assert hashed == []
+        # A different file that hashes alike matches on the perceptual hash
+        assert await classifications.get("def", phash) == (SALAD, "0f0f")
+        assert classifications.stats()["perceptual_hits"] == 1
+
+    asyncio.run(scenario())
+
+
+def test_without_perceptual_matching_nothing_is_hashed(monkeypatch):
+    monkeypatch.setattr(cache, "FOOD_PERCEPTUAL_HASH", False)
+
+    async def scenario():
+        classifications = ClassificationCache(None)
+        await classifications.set("abc", None, SALAD)
+
+        async def phash():
+            raise AssertionError("hashed with perceptual matching off")
+
+        assert await classifications.get("def", phash) == (None, None)
+        assert classifications.stats()["misses"] == 1
+
+    asyncio.run(scenario())
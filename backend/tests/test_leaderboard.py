@@ -0,0 +1,58 @@
+from datetime import timedelta
+
+import decay
+
+
+def store_pet(app, client, user_id, happiness, hours_ago):
+    # Stats as of `hours_ago`, ranked the way every write ranks them
+    pet = dict(
+        client.get(f"/user/pet/{user_id}").json(),
+        happiness=happiness,
+        stats_updated_at=decay.stamp(decay.now() - timedelta(hours=hours_ago)),
+    )
+    client.portal.call(app.repo.put_pet, pet)
+    client.portal.call(app.repo.rank_pet, pet)
+
+
+def test_board_shows_the_decayed_happiness(app, client, create_user):
+    create_user(1)
+    store_pet(app, client, 1, happiness=80, hours_ago=10.5)
+
+    shown = client.get("/user/pet/1").json()["happiness"]
+    entry, = client.get("/leaderboard").json()["items"]
+    assert shown == 80 - int(decay.DECAY_PER_HOUR["happiness"] * 10.5)
+    assert entry["happiness"] == shown
+
+
+def test_board_orders_pets_by_current_happiness(app, client, create_user):
+    for user_id in (1, 2, 3):
+        create_user(user_id)
+    # Stored 90 a day ago reads lower now than a fresh 75
+    store_pet(app, client, 1, happiness=90, hours_ago=24.5)
+    store_pet(app, client, 2, happiness=75, hours_ago=0)
+    store_pet(app, client, 3, happiness=50, hours_ago=0)
+
+    items = client.get("/leaderboard").json()["items"]
+    pets = {user_id: client.get(f"/user/pet/{user_id}").json()["happiness"] for user_id in (1, 2, 3)}
+    assert [item["user_id"] for item in items] == sorted(pets, key=pets.get, reverse=True) == [2, 1, 3]
+    assert {item["user_id"]: item["happiness"] for item in items} == pets
+
+    around = client.get("/leaderboard/1", params={"radius": 1}).json()
+    assert around["rank"] == 2
+    assert [entry["user_id"] for entry in around["entries"]] == [2, 1, 3]
+
+
+def test_wake_moves_the_pet_on_the_board(client, create_user):
+    create_user(1)
+    client.post("/user/1/activity/wake")
+
+    entry, = client.get("/leaderboard").json()["items"]
+    assert entry["happiness"] == client.get("/user/pet/1").json()["happiness"]
+
+
+def test_renamed_pet_shows_its_new_name(client, create_user):
+    create_user(1)
+    assert client.patch("/user/pet/1", json={"pet_name": "Mochi"}).status_code == 200
+
+    entry, = client.get("/leaderboard").json()["items"]
+    assert entry["pet_name"] == "Mochi"
@@ -0,0 +1,19 @@
+import pytest
+
+
+@pytest.mark.parametrize("field", ["happiness", "pet_name", "meal_per_day"])
+def test_null_pet_fields_are_refused(client, create_user, field):
+    create_user(1)
+    before = client.get("/user/pet/1").json()
+
+    response = client.patch("/user/pet/1", json={field: None})
+    assert response.status_code == 422
+    assert client.get("/user/pet/1").json() == before
+
+
+def test_activity_times_can_be_cleared(client, create_user):
+    create_user(1)
+    client.post("/user/1/activity/sleep")
+
+    assert client.patch("/user/activity/1", json={"sleep_time": None}).status_code == 200
+    assert client.get("/user/activity/1").json()["sleep_time"] is None
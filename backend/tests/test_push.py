@@ -0,0 +1,34 @@
+import asyncio
+import json
+
+import pytest
+
+WRITES = [
+    ("post", "/user/1/activity/sleep", {}, "activity"),
+    ("post", "/user/1/activity/exercise", {"params": {"exercise_dur": 0.5}}, "activity"),
+    ("post", "/user/1/activity/meal", {"json": {"meal_name": "apple", "healthy_score": 8}}, "activity"),
+    ("patch", "/user/activity/1", {"json": {"wake_up_time": "06:30:00"}}, "activity"),
+    ("patch", "/user/pet/1", {"json": {"pet_name": "Mochi"}}, "pet"),
+    ("post", "/user/1/activity/wake", {}, "pet"),
+]
+
+
+def next_updates(app, client, subscriber):
+    async def wait():
+        return await asyncio.wait_for(subscriber.next(), 2)
+    return client.portal.call(wait)
+
+
+@pytest.mark.parametrize("method,path,kwargs,kind", WRITES)
+def test_write_pushes_the_new_document(app, client, create_user, method, path, kwargs, kind):
+    create_user(1)
+    subscriber = client.portal.call(app.push_hub.subscribe, 1)
+    try:
+        assert getattr(client, method)(path, **kwargs).status_code == 200
+        updates = next_updates(app, client, subscriber)
+    finally:
+        client.portal.call(app.push_hub.unsubscribe, subscriber)
+
+    # Whatever the write path, the stream carries what a read returns right after
+    document = client.get(f"/user/{kind}/1").json()
+    assert json.loads(updates[kind]) == document
@@ -0,0 +1,92 @@
+from datetime import date, timedelta
+
+
+def day_totals(client, user_id, period="day"):
+    response = client.get(f"/user/{user_id}/stats/rollups", params={"period": period, "count": 1})
+    assert response.status_code == 200
+    return response.json()["items"][0]
+
+
+def activity(exercise_duration, meals):
+    return {
+        "activity_id": 1,
+        "date": date.today().isoformat(),
+        "wake_up_time": None,
+        "sleep_time": None,
+        "exercise_duration": exercise_duration,
+        "meals": meals,
+    }
+
+
+def test_rewriting_a_day_adds_only_the_difference(client, create_user):
+    create_user(1)
+    salad = {"meal_name": "salad", "healthy_score": 8}
+    client.post("/user/activity/1", json=activity(30, [salad]))
+    # Read once so the second write updates a cached total as well as the stored one
+    assert day_totals(client, 1)["exercise"] == 30
+
+    client.post("/user/activity/1", json=activity(45, [salad, {"meal_name": "cake", "healthy_score": 2}]))
+
+    for period in ("day", "week", "month"):
+        totals = day_totals(client, 1, period)
+        assert (totals["exercise"], totals["meals"], totals["healthy_score"]) == (45, 2, 10)
+
+
+def test_logged_exercise_and_meals_add_their_deltas(client, create_user):
+    create_user(1)
+    client.post("/user/1/activity/exercise", params={"exercise_dur": 20})
+    client.post("/user/1/activity/exercise", params={"exercise_dur": 50})
+    client.post("/user/1/activity/meal", json={"meal_name": "salad", "healthy_score": 7})
+
+    totals = day_totals(client, 1)
+    assert (totals["exercise"], totals["meals"], totals["healthy_score"]) == (50, 1, 7)
+    assert totals["avg_healthy_score"] == 7
+
+
+def test_cached_and_stored_totals_agree(app, client, create_user):
+    create_user(1)
+    client.post("/user/1/activity/exercise", params={"exercise_dur": 15})
+    day_totals(client, 1)  # cached in Redis from here on
+    client.post("/user/1/activity/meal", json={"meal_name": "soup", "healthy_score": 5})
+    cached = day_totals(client, 1)
+
+    # Without the Redis copies the totals are rebuilt from the stored counters
+    client.portal.call(app.repo.redis.flushall)
+    assert day_totals(client, 1) == cached
+
+
+def test_history_holds_what_the_rollups_count(client, create_user):
+    # History is what jobs/backfill_rollups.py rebuilds the totals from
+    create_user(1)
+    salad = {"meal_name": "salad", "healthy_score": 8}
+    client.post("/user/1/activity/meal", json=salad)
+    client.post("/user/1/activity/exercise", params={"exercise_dur": 30})
+    client.post("/user/1/activity/meal", json={"meal_name": "cake", "healthy_score": 2})
+
+    today, = client.get("/user/1/activity/history").json()["items"]
+    totals = day_totals(client, 1)
+    assert today["meals"] == [salad, {"meal_name": "cake", "healthy_score": 2}]
+    assert (today["exercise_duration"], len(today["meals"])) == (totals["exercise"], totals["meals"]) == (30, 2)
+
+
+def test_logged_exercise_starts_the_day_in_history(client, create_user):
+    # Like Cassandra's UPDATE, the first write of a day creates its history row
+    create_user(1)
+    client.post("/user/1/activity/exercise", params={"exercise_dur": 25})
+
+    today, = client.get("/user/1/activity/history").json()["items"]
+    assert (today["date"], today["exercise_duration"]) == (date.today().isoformat(), 25)
+
+
+def test_history_pages_keep_the_first_pages_range(client, create_user):
+    create_user(1)
+    for days_ago in (0, 1, 6, 7):
+        day = dict(activity(10, []), date=(date.today() - timedelta(days=days_ago)).isoformat())
+        client.post("/user/activity/1", json=day)
+
+    # The default range is the last 7 days, so the day a week ago is not in it
+    first = client.get("/user/1/activity/history", params={"limit": 2}).json()
+    following = client.get("/user/1/activity/history", params={"limit": 2, "start": first["start"], "end": first["next"]}).json()
+    days = [item["date"] for item in first["items"] + following["items"]]
+    assert days == [(date.today() - timedelta(days=days_ago)).isoformat() for days_ago in (0, 1, 6)]
+    assert following["next"] is None
@@ -0,0 +1,80 @@
+import time
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+
+def event(event_id, type, **fields):
+    return dict(dict(event_id=event_id, user_id=1, type=type, timestamp=datetime.now().isoformat()), **fields)
+
+
+def statuses(response):
+    assert response.status_code == 200
+    return [result["status"] for result in response.json()["results"]]
+
+
+def test_resent_events_are_not_applied_twice(client, create_user):
+    create_user(1)
+    batch = {"events": [
+        event("m1", "meal", meal={"meal_name": "salad", "healthy_score": 8}),
+        event("x1", "exercise", exercise_dur=30),
+    ]}
+
+    assert statuses(client.post("/sync/events", json=batch)) == ["applied", "applied"]
+    assert statuses(client.post("/sync/events", json=batch)) == ["duplicate", "duplicate"]
+
+    activity = client.get("/user/activity/1").json()
+    assert activity["meals"] == [{"meal_name": "salad", "healthy_score": 8}]
+    assert activity["exercise_duration"] == 30
+
+
+def test_repeated_event_in_one_batch_is_a_duplicate(client, create_user):
+    create_user(1)
+    meal = event("m1", "meal", meal={"meal_name": "soup", "healthy_score": 6})
+
+    assert statuses(client.post("/sync/events", json={"events": [meal, meal]})) == ["applied", "duplicate"]
+    assert len(client.get("/user/activity/1").json()["meals"]) == 1
+
+
+def test_invalid_event_can_be_resent_corrected(client, create_user):
+    create_user(1)
+    incomplete = event("x1", "exercise")
+
+    assert statuses(client.post("/sync/events", json={"events": [incomplete]})) == ["invalid"]
+    assert statuses(client.post("/sync/events", json={"events": [dict(incomplete, exercise_dur=20)]})) == ["applied"]
+    assert client.get("/user/activity/1").json()["exercise_duration"] == 20
+
+
+def test_events_of_unknown_users_can_be_retried(client, create_user):
+    lost = dict(event("m1", "meal", meal={"meal_name": "soup", "healthy_score": 6}), user_id=2)
+
+    assert statuses(client.post("/sync/events", json={"events": [lost]})) == ["error"]
+    create_user(2)
+    assert statuses(client.post("/sync/events", json={"events": [lost]})) == ["applied"]
+
+
+@pytest.fixture
+def server_timezone(monkeypatch):
+    # A server clock that is not UTC, so UTC timestamps have to be converted
+    monkeypatch.setenv("TZ", "America/New_York")
+    time.tzset()
+    yield
+    monkeypatch.undo()
+    time.tzset()
+
+
+def test_utc_timestamps_are_taken_as_server_time(client, create_user, server_timezone):
+    create_user(1)
+    woke_at = datetime.now(timezone.utc).replace(microsecond=0)
+    slept_at = woke_at - timedelta(hours=8)
+    batch = {"events": [
+        # What a JS client's toISOString() sends
+        event("s1", "sleep", timestamp=slept_at.isoformat().replace("+00:00", "Z")),
+        event("w1", "wake", timestamp=woke_at.isoformat().replace("+00:00", "Z")),
+    ]}
+
+    assert statuses(client.post("/sync/events", json=batch)) == ["applied", "applied"]
+    day, = client.get("/user/1/activity/history").json()["items"]
+    assert day["sleep_time"] == slept_at.astimezone().strftime("%H:%M:%S")
+    assert day["wake_up_time"] == woke_at.astimezone().strftime("%H:%M:%S")
+    assert day["sleep_hours"] == pytest.approx(8)
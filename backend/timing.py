@@ -0,0 +1,22 @@
+from time import perf_counter
+
+
+class StageTimer:
+    """Records how long each stage of a request took, in milliseconds."""
+
+    def __init__(self):
+        self.stages = {}
+        self._last = perf_counter()
+
+    def mark(self, stage):
+        now = perf_counter()
+        self.stages[stage] = (now - self._last) * 1000
+        self._last = now
+
+    @property
+    def total(self):
+        return sum(self.stages.values())
+
+    def server_timing(self):
+        # Value for the Server-Timing response header (visible in browser dev tools / curl -v)
+        return ", ".join(f"{stage};dur={ms:.2f}" for stage, ms in self.stages.items())